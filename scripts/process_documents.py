@@ -7,6 +7,7 @@ Note: For SEC EDGAR, download_financial_docs.py gives full-submission.txt direct
 
 Run: python scripts/process_documents.py
 """
+
 from pathlib import Path
 
 PROJECT_ROOT = Path(__file__).resolve().parent.parent
@@ -15,8 +16,28 @@ OUTPUT_DIR = PROJECT_ROOT / "sec-edgar-filings" / "processed"
 MIN_TEXT_LENGTH = 1000  # Warn if extracted text is shorter (likely wrong file type)
 
 
+def _html_to_text(raw: str) -> str | None:
+    """
+    Strip tags with selectolax's lexbor (C HTML5 parser), dropping script/style.
+    Returns None if selectolax is not installed.
+    """
+    try:
+        from selectolax.lexbor import LexborHTMLParser
+    except ImportError:
+        return None
+
+    tree = LexborHTMLParser(raw)
+    for node in tree.css("script, style"):
+        node.decompose()
+    text = tree.text(separator="\n", strip=True)
+    return "\n".join(line for line in text.splitlines() if line)
+
+
 def extract_from_xml(path: Path) -> str:
-    """Extract text from XML. Strips tags, keeps content."""
+    """Extract text from XML. Strips tags, keeps content (including CDATA sections).
+
+    Stays on BeautifulSoup: lexbor parses as HTML5 and drops CDATA.
+    """
     try:
         from bs4 import BeautifulSoup
     except ImportError:
@@ -34,13 +55,18 @@ def extract_from_xml(path: Path) -> str:
 
 
 def extract_from_html(path: Path) -> str:
-    """Extract text from HTML."""
+    """Extract text from HTML (selectolax/lexbor; BeautifulSoup fallback)."""
+    raw = path.read_text(encoding="utf-8", errors="ignore")
+    text = _html_to_text(raw)
+    if text is not None:
+        return text
+
     try:
         from bs4 import BeautifulSoup
     except ImportError:
-        return path.read_text(encoding="utf-8", errors="ignore")
+        return raw
 
-    soup = BeautifulSoup(path.read_text(encoding="utf-8", errors="ignore"), "html.parser")
+    soup = BeautifulSoup(raw, "html.parser")
     for tag in soup(["script", "style"]):
         tag.decompose()
     text = soup.get_text(separator="\n", strip=True)
@@ -101,7 +127,9 @@ def process_data_folder():
             out_path = OUTPUT_DIR / out_name
 
             if len(text) < MIN_TEXT_LENGTH:
-                print(f"  Warning: {path.name} → only {len(text)} chars (may be wrong file type, e.g. viewer page)")
+                print(
+                    f"  Warning: {path.name} → only {len(text)} chars (may be wrong file type, e.g. viewer page)"
+                )
 
             out_path.write_text(text, encoding="utf-8")
             print(f"  {path.name} → {out_path} ({len(text):,} chars)")
@@ -17,6 +17,7 @@ Run: uvicorn tiny_rag.api:app --host 0.0.0.0 --port 8001
 import os
 import time
 import uuid
+from contextlib import asynccontextmanager
 
 from dotenv import load_dotenv
 
@@ -30,6 +31,7 @@ from pydantic import BaseModel
 from starlette.middleware.base import BaseHTTPMiddleware
 from starlette.requests import Request
 
+from .db import close_pool
 from .health import check_database, check_ollama
 from .logging_config import get_logger
 from .rag import answer_with_rag, infer_ticker_from_query
@@ -50,7 +52,15 @@ def verify_api_key(api_key: str | None = Depends(api_key_header)) -> None:
         raise HTTPException(status_code=401, detail="Invalid or missing API key")
 
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Close pooled DB connections on shutdown."""
+    yield
+    close_pool()
+
+
 app = FastAPI(
+    lifespan=lifespan,
     title="Tiny RAG API",
     description="Ask questions about 10-K financial documents. Requires X-API-Key header if API_KEY is set.",
     version="0.1.0",
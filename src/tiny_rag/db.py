@@ -0,0 +1,77 @@
+"""
+Shared PostgreSQL connection pool for ingest and retrieve.
+
+GUIDE:
+------
+- pooled_connection() → Check out a connection (context manager); returned on exit
+- close_pool()        → Close all pooled connections (API shutdown, end of ingest)
+
+Connections are opened lazily and reused, so a query or a COPY batch doesn't pay a
+TCP + auth handshake. Per-connection setup (register_vector, PREPARE) is left to the
+caller, since the vector extension may not exist yet on a fresh database.
+
+Requires: DATABASE_URL
+"""
+
+import os
+import threading
+from contextlib import contextmanager
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Default: use current user (macOS/Homebrew) or postgres (Docker)
+_default_user = os.environ.get("USER", "postgres")
+DATABASE_URL = os.getenv(
+    "DATABASE_URL",
+    f"postgresql://{_default_user}@localhost:5432/rag_db",
+)
+
+POOL_MIN_CONN = 1
+POOL_MAX_CONN = 8
+
+_pool = None
+_pool_lock = threading.Lock()
+# ThreadedConnectionPool raises instead of blocking when exhausted; callers wait here
+_pool_slots = threading.BoundedSemaphore(POOL_MAX_CONN)
+
+
+def _get_pool():
+    """Lazy-create the shared connection pool."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                from psycopg2.pool import ThreadedConnectionPool
+
+                _pool = ThreadedConnectionPool(POOL_MIN_CONN, POOL_MAX_CONN, DATABASE_URL)
+    return _pool
+
+
+@contextmanager
+def pooled_connection():
+    """Check out a pooled connection; broken connections are closed, not reused."""
+    import psycopg2
+
+    with _pool_slots:
+        pool = _get_pool()
+        conn = pool.getconn()
+        broken = False
+        try:
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            broken = True
+            raise
+        finally:
+            # Open transactions are rolled back by putconn
+            pool.putconn(conn, close=broken or conn.closed)
+
+
+def close_pool() -> None:
+    """Close every pooled connection. The next pooled_connection() opens a new pool."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
@@ -0,0 +1,194 @@
+"""
+Shared SentenceTransformer loader for ingest and retrieve.
+
+Both sides must embed with the same model and backend, or stored and query vectors
+won't be comparable — re-ingest after changing any of these.
+
+Env: EMBEDDING_BACKEND=torch|onnx|openvino (default torch)
+     EMBEDDING_MODEL_FILE=onnx/model_qint8_avx512_vnni.onnx (optional; picks one of the
+       exports shipped in the model repo, e.g. an INT8 dynamic-quantized ONNX graph)
+     EMBEDDING_DEVICE=cuda|mps|cpu (optional; default picks CUDA, then Apple MPS, then CPU)
+
+The onnx backend needs sentence-transformers>=3.2 with extras: pip install "sentence-transformers[onnx]"
+
+embed_texts() puts a persistent cache in front of the model: vectors are stored (fp16) in a
+sqlite file under EMBEDDING_CACHE_DIR, keyed by a blake2b hash of model config + text, so
+re-ingesting unchanged filings and repeated queries skip the forward pass.
+"""
+
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+from pathlib import Path
+
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from .logging_config import get_logger
+
+logger = get_logger(__name__)
+
+# Suppress SentenceTransformers BertModel load report (UNEXPECTED key warnings)
+logging.getLogger("sentence_transformers").setLevel(logging.WARNING)
+
+EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch").strip().lower()
+EMBEDDING_MODEL_FILE = os.getenv("EMBEDDING_MODEL_FILE", "").strip()
+EMBEDDING_DEVICE = os.getenv("EMBEDDING_DEVICE", "").strip().lower() or None
+
+# encode() batch size: larger batches keep a GPU busy; on CPU they only add padding
+EMBED_BATCH_SIZE_CPU = 64
+EMBED_BATCH_SIZE_ACCELERATOR = 128
+
+_PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
+# Set EMBEDDING_CACHE_DIR="" to disable the on-disk embedding cache
+_embedding_cache_dir = os.getenv("EMBEDDING_CACHE_DIR", str(_PROJECT_ROOT / ".emb_cache"))
+EMBEDDING_CACHE_DIR = Path(_embedding_cache_dir) if _embedding_cache_dir else None
+CACHE_LOOKUP_BATCH = 500  # keys per SELECT ... IN (...), under SQLite's bound-parameter limit
+
+_embedding_model = None
+_model_lock = threading.Lock()
+_cache_conn = None
+_cache_failed = False  # opening the cache failed once; don't retry on every call
+_cache_lock = threading.Lock()
+
+
+def load_embedding_model():
+    """
+    Build the SentenceTransformer for the configured backend.
+
+    ONNX Runtime (graph fusion, optional INT8 weights) is typically 2-4x faster than
+    PyTorch on CPU; SentenceTransformers keeps the same mean pooling + normalize steps.
+    """
+    from sentence_transformers import SentenceTransformer
+
+    if EMBEDDING_BACKEND == "torch":
+        # device=None lets SentenceTransformers pick cuda > mps > cpu
+        model = SentenceTransformer(EMBEDDING_MODEL_NAME, device=EMBEDDING_DEVICE)
+        if model.device.type == "cuda":
+            # fp16 weights: ~2x throughput, half the memory; vectors are stored as fp16 anyway
+            model.half()
+        return model
+
+    model_kwargs = {"file_name": EMBEDDING_MODEL_FILE} if EMBEDDING_MODEL_FILE else None
+    return SentenceTransformer(
+        EMBEDDING_MODEL_NAME,
+        device=EMBEDDING_DEVICE,
+        backend=EMBEDDING_BACKEND,
+        model_kwargs=model_kwargs,
+    )
+
+
+def get_embedding_model():
+    """Lazy-load and cache the model (thread-safe: eval/API call from threads)."""
+    global _embedding_model
+    if _embedding_model is None:
+        with _model_lock:
+            if _embedding_model is None:
+                _embedding_model = load_embedding_model()
+    return _embedding_model
+
+
+def _default_batch_size(model) -> int:
+    """Bigger encode() batches on CUDA/MPS (torch backend); ONNX/OpenVINO run on CPU here."""
+    if EMBEDDING_BACKEND == "torch" and model.device.type != "cpu":
+        return EMBED_BATCH_SIZE_ACCELERATOR
+    return EMBED_BATCH_SIZE_CPU
+
+
+def _cache_key(text: str) -> bytes:
+    """blake2b of the text, salted with the model config so backends never share vectors."""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"{EMBEDDING_MODEL_NAME}|{EMBEDDING_BACKEND}|{EMBEDDING_MODEL_FILE}\0".encode())
+    digest.update(text.encode("utf-8"))
+    return digest.digest()
+
+
+def _get_cache():
+    """Lazy-open the sqlite cache; None if disabled or unusable. Call with _cache_lock held."""
+    global _cache_conn, _cache_failed
+    if _cache_conn is None and EMBEDDING_CACHE_DIR is not None and not _cache_failed:
+        try:
+            EMBEDDING_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(
+                EMBEDDING_CACHE_DIR / "embeddings.sqlite3", check_same_thread=False
+            )
+            # WAL: the API and an ingest run can read/write the cache at the same time
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings "
+                "(key BLOB PRIMARY KEY, vector BLOB NOT NULL) WITHOUT ROWID"
+            )
+            conn.commit()
+            _cache_conn = conn
+        except (OSError, sqlite3.Error) as e:
+            logger.warning("embedding_cache_disabled", path=str(EMBEDDING_CACHE_DIR), error=str(e))
+            _cache_failed = True
+    return _cache_conn
+
+
+def _cache_lookup(conn, keys: list[bytes]) -> dict[bytes, np.ndarray]:
+    """Fetch cached fp16 vectors for the given keys."""
+    found = {}
+    for i in range(0, len(keys), CACHE_LOOKUP_BATCH):
+        batch = keys[i : i + CACHE_LOOKUP_BATCH]
+        placeholders = ",".join("?" * len(batch))
+        rows = conn.execute(
+            f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+        )
+        found.update((key, np.frombuffer(vector, dtype=np.float16)) for key, vector in rows)
+    return found
+
+
+def embed_texts(texts: list[str], **encode_kwargs) -> np.ndarray:
+    """
+    Embed texts as a (len(texts), dim) float32 array of unit-norm vectors.
+
+    Texts already in the cache are not re-encoded; the rest (deduplicated) go through
+    model.encode(**encode_kwargs) and are added to the cache. batch_size defaults to
+    EMBED_BATCH_SIZE_ACCELERATOR on CUDA/MPS, else EMBED_BATCH_SIZE_CPU. Vectors are
+    rounded to fp16 either way, the precision pgvector stores (halfvec), so a cache hit
+    returns exactly what a miss would.
+    """
+    if not texts:
+        return np.empty((0, 0), dtype=np.float32)
+
+    keys = [_cache_key(text) for text in texts]
+    unique_keys = list(dict.fromkeys(keys))
+    vectors = {}
+    with _cache_lock:
+        cache = _get_cache()
+        if cache is not None:
+            try:
+                vectors = _cache_lookup(cache, unique_keys)
+            except sqlite3.Error as e:
+                logger.warning("embedding_cache_read_failed", error=str(e))
+
+    texts_by_key = dict(zip(keys, texts))
+    missing = [key for key in unique_keys if key not in vectors]
+    if missing:
+        model = get_embedding_model()
+        encode_kwargs.setdefault("batch_size", _default_batch_size(model))
+        encoded = model.encode(
+            [texts_by_key[key] for key in missing],
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+            **encode_kwargs,
+        ).astype(np.float16)
+        vectors.update(zip(missing, encoded))
+        if cache is not None:
+            with _cache_lock:
+                try:
+                    cache.executemany(
+                        "INSERT OR IGNORE INTO embeddings (key, vector) VALUES (?, ?)",
+                        ((key, vectors[key].tobytes()) for key in missing),
+                    )
+                    cache.commit()
+                except sqlite3.Error as e:
+                    logger.warning("embedding_cache_write_failed", error=str(e))
+
+    return np.stack([vectors[key] for key in keys]).astype(np.float32)
@@ -4,32 +4,59 @@ Evaluate RAG on a set of Q&A pairs.
 GUIDE:
 ------
 1. load_qa_pairs() → Load from eval_qa.json (q, ticker, expected_keywords)
-2. run_eval()      → For each question: answer_with_rag() → check keywords → record
+2. run_eval()      → For each question: answer_with_rag_async() → check keywords → record
+                     (EVAL_CONCURRENCY questions generating at once, EVAL_PREFETCH more
+                      retrieving ahead; results keep input order; time_sec includes waiting
+                      for a free Ollama slot; a question that raises becomes an ERROR row;
+                      EVAL_BATCH_SIZE > 1 groups that many questions, sent in as few
+                      Ollama calls as fit OLLAMA_BATCH_NUM_CTX)
 3. print_report()  → Summary: passed/failed, per-question details
 4. save_to_excel() → Write eval_results.xlsx (question, answer, ticker, sources_count, time_sec, passed, keywords_found, keywords_missed)
+   save_to_parquet() → Same rows as eval_results.parquet (zstd), for programmatic use (needs pyarrow)
 
 expected_keywords: You define in JSON. Eval checks if answer contains them.
-  PASS = all found; FAIL = any missed; N/A = no keywords defined
+  PASS = all found; FAIL = any missed; N/A = no keywords defined; ERROR = RAG call failed
 
 Run: python -m tiny_rag.eval
-Runtime: ~10–15 min for 50 questions (each ~10–20 seconds)
+Runtime: ~10–20 seconds per question, overlapped EVAL_CONCURRENCY at a time
 """
 
 from dotenv import load_dotenv
 
 load_dotenv()
 
+import asyncio
 import json
+import os
+import re
 
 from .logging_config import get_logger
 
 logger = get_logger(__name__)
 import time
+from importlib.util import find_spec
 from pathlib import Path
 
-import pandas as pd
+import xlsxwriter
 
-from .rag import answer_with_rag, infer_ticker_from_query
+from .rag import (
+    answer_batch_with_rag_async,
+    answer_with_rag_async,
+    infer_ticker_from_query,
+    make_async_ollama_client,
+)
+
+# Questions evaluated concurrently; each mostly waits on Ollama, not CPU.
+# Ollama only generates in parallel up to its OLLAMA_NUM_PARALLEL setting (server side).
+EVAL_CONCURRENCY = int(os.getenv("EVAL_CONCURRENCY", "4"))
+# Extra questions whose retrieval runs ahead while all Ollama slots are busy, so their
+# context is ready the moment a slot frees up
+EVAL_PREFETCH = int(os.getenv("EVAL_PREFETCH", str(EVAL_CONCURRENCY)))
+# Questions sharing one Ollama prompt (1 = one call per question). Suits short answers
+# over small contexts; a group too big for OLLAMA_BATCH_NUM_CTX/2 is split into sub-batches
+EVAL_BATCH_SIZE = int(os.getenv("EVAL_BATCH_SIZE", "1"))
+# Keyword lists at least this long use Aho-Corasick (if installed); shorter ones a regex
+AHOCORASICK_MIN_KEYWORDS = 10
 
 
 def load_qa_pairs(path: str = "eval_qa.json") -> list[dict]:
@@ -38,39 +65,193 @@ def load_qa_pairs(path: str = "eval_qa.json") -> list[dict]:
         return json.load(f)
 
 
-def run_eval(qa_pairs: list[dict], k: int = 6) -> list[dict]:
-    """Run RAG on each question and collect results."""
-    results = []
-    total = len(qa_pairs)
-    for i, item in enumerate(qa_pairs):
-        q = item["q"]
-        ticker = item.get("ticker") or infer_ticker_from_query(q)
-        logger.info("eval_progress", index=i + 1, total=total, question=q[:60])
+def _regex_hits(answer_lower: str, lowered: list[str]) -> set[str]:
+    """Lowercased keywords present in the answer, via one compiled-regex pass."""
+    # Longest first so a keyword is never shadowed by a shorter prefix of itself
+    alternation = sorted({re.escape(kw) for kw in lowered}, key=len, reverse=True)
+    hits = set(re.findall("|".join(alternation), answer_lower))
+    # Non-overlapping scan: a keyword inside another hit ("cloud" in "cloud revenue") is missed
+    return hits | {kw for kw in lowered if kw not in hits and kw in answer_lower}
+
+
+def _ahocorasick_hits(answer_lower: str, lowered: list[str]) -> set[str] | None:
+    """_regex_hits via an Aho-Corasick automaton (reports overlaps); None if not installed."""
+    try:
+        import ahocorasick
+    except ImportError:
+        return None
+
+    automaton = ahocorasick.Automaton()
+    for kw in lowered:
+        if kw:
+            automaton.add_word(kw, kw)
+    if not len(automaton):
+        return set(lowered)  # only empty keywords, which every answer contains
+    automaton.make_automaton()
+    hits = {kw for _, kw in automaton.iter(answer_lower)}
+    return hits | ({""} & set(lowered))
+
+
+def match_keywords(answer: str, expected: list[str]) -> tuple[list[str], list[str]]:
+    """Split expected keywords into (found, missed) by case-insensitive substring match.
+
+    The answer is scanned once: with a compiled regex alternation, or for long keyword
+    lists with pyahocorasick when installed (pip install -e ".[eval]").
+    """
+    if not expected:
+        return [], []
+    answer_lower = answer.lower()
+    lowered = [kw.lower() for kw in expected]
+    hits = None
+    if len(lowered) >= AHOCORASICK_MIN_KEYWORDS:
+        hits = _ahocorasick_hits(answer_lower, lowered)
+    if hits is None:
+        hits = _regex_hits(answer_lower, lowered)
+    found, missed = [], []
+    for kw, kw_lower in zip(expected, lowered):
+        (found if kw_lower in hits else missed).append(kw)
+    return found, missed
+
+
+async def _eval_one(
+    index: int,
+    total: int,
+    item: dict,
+    k: int,
+    in_flight: asyncio.Semaphore,
+    llm_slots: asyncio.Semaphore,
+    client,
+) -> dict:
+    """Answer one Q&A item and check its expected keywords."""
+    q = item["q"]
+    ticker = item.get("ticker") or infer_ticker_from_query(q)
+    async with in_flight:
+        logger.info("eval_progress", index=index + 1, total=total, question=q[:60])
         start = time.perf_counter()
-        result = answer_with_rag(q, k=k, ticker=ticker)
+        result = await answer_with_rag_async(
+            q, k=k, ticker=ticker, client=client, llm_slots=llm_slots
+        )
         elapsed = time.perf_counter() - start
-        logger.info("eval_done", index=i + 1, elapsed_sec=round(elapsed, 1))
-
-        # Check expected keywords if provided
-        expected = item.get("expected_keywords", [])
-        answer_lower = result["answer"].lower()
-        keywords_found = [kw for kw in expected if kw.lower() in answer_lower]
-        keywords_missed = [kw for kw in expected if kw.lower() not in answer_lower]
-        passed = len(keywords_missed) == 0 if expected else None
-
-        results.append(
-            {
-                "question": q,
-                "answer": result["answer"],
-                "sources_count": len(result["sources"]),
-                "ticker": ticker,
-                "time_sec": round(elapsed, 2),
-                "keywords_found": ", ".join(keywords_found),
-                "keywords_missed": ", ".join(keywords_missed),
-                "passed": "PASS" if passed else ("FAIL" if passed is False else "N/A"),
-            }
+    logger.info("eval_done", index=index + 1, elapsed_sec=round(elapsed, 1))
+    return _result_row(item, ticker, result, elapsed)
+
+
+async def _eval_batch(
+    indices: list[int],
+    total: int,
+    items: list[dict],
+    k: int,
+    in_flight: asyncio.Semaphore,
+    llm_slots: asyncio.Semaphore,
+    client,
+) -> list[dict]:
+    """Answer several Q&A items with one batched Ollama call; time_sec is the batch's."""
+    queries = [item["q"] for item in items]
+    tickers = [item.get("ticker") or infer_ticker_from_query(q) for item, q in zip(items, queries)]
+    async with in_flight:
+        logger.info("eval_progress", index=indices[0] + 1, total=total, batch=len(items))
+        start = time.perf_counter()
+        results = await answer_batch_with_rag_async(
+            queries, tickers, k=k, client=client, llm_slots=llm_slots
+        )
+        elapsed = time.perf_counter() - start
+    logger.info("eval_done", index=indices[0] + 1, batch=len(items), elapsed_sec=round(elapsed, 1))
+    return [
+        _result_row(item, ticker, result, elapsed)
+        for item, ticker, result in zip(items, tickers, results)
+    ]
+
+
+def _result_row(item: dict, ticker: str | None, result: dict, elapsed: float) -> dict:
+    """Result row for an answered question, with its expected keywords checked."""
+    expected = item.get("expected_keywords", [])
+    keywords_found, keywords_missed = match_keywords(result["answer"], expected)
+    passed = len(keywords_missed) == 0 if expected else None
+
+    return {
+        "question": item["q"],
+        "answer": result["answer"],
+        "sources_count": len(result["sources"]),
+        "ticker": ticker,
+        "time_sec": round(elapsed, 2),
+        "keywords_found": ", ".join(keywords_found),
+        "keywords_missed": ", ".join(keywords_missed),
+        "passed": "PASS" if passed else ("FAIL" if passed is False else "N/A"),
+    }
+
+
+def _error_row(item: dict, exc: Exception) -> dict:
+    """Result row for a question whose RAG call raised."""
+    q = item["q"]
+    return {
+        "question": q,
+        "answer": f"ERROR: {exc}",
+        "sources_count": 0,
+        "ticker": item.get("ticker") or infer_ticker_from_query(q),
+        "time_sec": None,
+        "keywords_found": "",
+        "keywords_missed": ", ".join(item.get("expected_keywords", [])),
+        "passed": "ERROR",
+    }
+
+
+async def run_eval_async(
+    qa_pairs: list[dict],
+    k: int = 6,
+    concurrency: int = EVAL_CONCURRENCY,
+    prefetch: int = EVAL_PREFETCH,
+    batch_size: int = EVAL_BATCH_SIZE,
+) -> list[dict]:
+    """
+    Run RAG on all questions, at most `concurrency` generating at a time. Results keep input order.
+
+    Up to `prefetch` further questions retrieve their context meanwhile, so retrieval
+    latency hides behind generation instead of adding to it. With batch_size > 1,
+    consecutive questions share one Ollama prompt (see answer_batch_with_rag_async) and
+    concurrency/prefetch count batches.
+    """
+    in_flight = asyncio.Semaphore(concurrency + prefetch)
+    llm_slots = asyncio.Semaphore(concurrency)
+    total = len(qa_pairs)
+    batch_size = max(1, batch_size)
+    groups = [list(range(i, min(i + batch_size, total))) for i in range(0, total, batch_size)]
+    async with make_async_ollama_client(concurrency) as client:
+        if batch_size == 1:
+            tasks = [
+                _eval_one(i, total, qa_pairs[i], k, in_flight, llm_slots, client) for (i,) in groups
+            ]
+        else:
+            tasks = [
+                _eval_batch(g, total, [qa_pairs[i] for i in g], k, in_flight, llm_slots, client)
+                for g in groups
+            ]
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+
+    # One failed question (Ollama/DB gave up after retries) is recorded, not fatal to the run
+    rows = []
+    for group, result in zip(groups, results):
+        if isinstance(result, Exception):
+            for i in group:
+                logger.error("eval_failed", question=qa_pairs[i]["q"][:60], error=str(result))
+                rows.append(_error_row(qa_pairs[i], result))
+        else:
+            rows.extend(result if batch_size > 1 else [result])
+    return rows
+
+
+def run_eval(
+    qa_pairs: list[dict],
+    k: int = 6,
+    concurrency: int = EVAL_CONCURRENCY,
+    prefetch: int = EVAL_PREFETCH,
+    batch_size: int = EVAL_BATCH_SIZE,
+) -> list[dict]:
+    """Run RAG on each question and collect results."""
+    return asyncio.run(
+        run_eval_async(
+            qa_pairs, k=k, concurrency=concurrency, prefetch=prefetch, batch_size=batch_size
         )
-    return results
+    )
 
 
 def print_report(results: list[dict]) -> None:
@@ -79,6 +260,7 @@ def print_report(results: list[dict]) -> None:
     passed = sum(1 for r in results if r["passed"] == "PASS")
     failed = sum(1 for r in results if r["passed"] == "FAIL")
     no_check = sum(1 for r in results if r["passed"] == "N/A")
+    errors = sum(1 for r in results if r["passed"] == "ERROR")
 
     logger.info(
         "eval_report",
@@ -86,6 +268,7 @@ def print_report(results: list[dict]) -> None:
         passed=passed,
         failed=failed,
         no_check=no_check,
+        errors=errors,
     )
 
     for i, r in enumerate(results, 1):
@@ -102,9 +285,34 @@ def print_report(results: list[dict]) -> None:
 
 
 def save_to_excel(results: list[dict], path: str | Path = "eval_results.xlsx") -> None:
-    """Save results to Excel with question and answer columns."""
-    df = pd.DataFrame(results)
-    df.to_excel(path, index=False, engine="openpyxl")
+    """Save results to Excel with question and answer columns.
+
+    Rows are streamed with xlsxwriter's constant_memory mode, so large sweeps never hold
+    the whole workbook in memory. Answers are written as plain text (no formula/URL parsing).
+    """
+    workbook = xlsxwriter.Workbook(
+        str(path),
+        {"constant_memory": True, "strings_to_formulas": False, "strings_to_urls": False},
+    )
+    sheet = workbook.add_worksheet()
+    columns = list(results[0]) if results else []
+    sheet.write_row(0, 0, columns, workbook.add_format({"bold": True}))
+    for row, r in enumerate(results, 1):
+        sheet.write_row(row, 0, [r[c] for c in columns])
+    workbook.close()
+    logger.info("eval_saved", path=str(path))
+
+
+def save_to_parquet(results: list[dict], path: str | Path = "eval_results.parquet") -> None:
+    """
+    Save results as zstd-compressed Parquet, for loading into pandas/DuckDB/polars.
+
+    Much smaller and faster to read back than .xlsx. Needs pyarrow (pip install -e ".[eval]").
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    pq.write_table(pa.Table.from_pylist(results), str(path), compression="zstd")
     logger.info("eval_saved", path=str(path))
 
 
@@ -120,6 +328,8 @@ def main():
     results = run_eval(qa)
     print_report(results)
     save_to_excel(results, project_root / "eval_results.xlsx")
+    if find_spec("pyarrow") is not None:
+        save_to_parquet(results, project_root / "eval_results.parquet")
 
 
 if __name__ == "__main__":
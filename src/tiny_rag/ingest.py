@@ -6,21 +6,38 @@ GUIDE:
 1. find_filing_txt_files()  → Discovers full-submission.txt in sec-edgar-filings/{ticker}/10-K/
 2. load_txt(path)           → Reads raw text from file
 3. chunk_with_overlap()     → Splits text into 400-token chunks with 100-token overlap (tiktoken)
-4. embed_chunks()           → Embeds each chunk with SentenceTransformers all-MiniLM-L6-v2
-5. store_in_pgvector()      → Inserts chunks + embeddings into documents table
+   - iter_chunks_with_overlap() yields the same chunks lazily
+   - iter_file_chunks() streams a filing through iter_text_windows() (1M-char pieces,
+     split where tokenization is unaffected), so a filing is never one big str
+   - tokenize_cached() memoizes token ids by content hash (memory + .tok_cache/ on disk)
+4. embed_chunks()           → Embeds a rolling batch of chunks (across filings) with SentenceTransformers all-MiniLM-L6-v2
+5. store_in_pgvector()      → Bulk-loads chunks + embeddings into documents table (COPY FROM STDIN,
+                               on a connection from the shared pool in db.py)
+6. create_indexes()         → After the load: HNSW (inner product) on embedding, btree on ticker, ANALYZE
 
 Run: python -m tiny_rag.ingest
 Requires: DATABASE_URL in .env, pgvector running, sec-edgar-filings/ populated
 """
 
+import functools
+import hashlib
+import io
 import os
+from array import array
+from collections import OrderedDict, deque
+from collections.abc import Iterable, Iterator
+from concurrent.futures import ProcessPoolExecutor
+from itertools import groupby
 from pathlib import Path
 
+import numpy as np
 import tiktoken
 from dotenv import load_dotenv
 
 load_dotenv()
 
+from .db import close_pool, pooled_connection
+from .embeddings import embed_texts
 from .logging_config import get_logger
 from .retry_config import retry_db
 
@@ -35,13 +52,31 @@ SEC_FILINGS_DIR = PROJECT_ROOT / "sec-edgar-filings"
 CHUNK_SIZE_TOKENS = 400
 CHUNK_OVERLAP_TOKENS = 100
 
-# pgvector connection (override with env: DATABASE_URL)
-# Default: use current user (macOS/Homebrew) or postgres (Docker)
-_default_user = os.environ.get("USER", "postgres")
-DATABASE_URL = os.getenv(
-    "DATABASE_URL",
-    f"postgresql://{_default_user}@localhost:5432/rag_db",
-)
+# Token cache: re-ingesting the same filing reuses its token ids instead of
+# re-running BPE. Set TOKEN_CACHE_DIR="" to disable the on-disk layer.
+_token_cache_dir = os.getenv("TOKEN_CACHE_DIR", str(PROJECT_ROOT / ".tok_cache"))
+TOKEN_CACHE_DIR = Path(_token_cache_dir) if _token_cache_dir else None
+TOKEN_CACHE_MIN_CHARS = 100_000  # shorter texts tokenize faster than a disk round trip
+TOKEN_MEMO_SIZE = 64  # in-memory entries for whole texts (chunk_with_overlap callers)
+
+# Filings are read and tokenized this many characters at a time (bounds peak memory)
+TEXT_WINDOW_CHARS = 1_000_000
+
+# Embedding: chunks are buffered across filings and embedded EMBED_FLUSH_ROWS at a
+# time, so memory stays bounded while each encode() call is still large enough for
+# SentenceTransformers to sort by length and pad per minibatch ("smart batching")
+EMBED_FLUSH_ROWS = 1024
+
+# Bulk load: rows per COPY FROM STDIN batch (bounds the in-memory buffer)
+COPY_BATCH_ROWS = 10_000
+COPY_SQL = "COPY documents (content, embedding, ticker, source) FROM STDIN WITH (FORMAT TEXT)"
+
+# COPY text format treats backslash, tab, and newlines as special inside a field
+_COPY_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+
+# ANN index, built once after the bulk load (cheaper than maintaining it row by row)
+HNSW_M = 16
+HNSW_EF_CONSTRUCTION = 64
 
 
 def load_txt(path: Path) -> str:
@@ -49,6 +84,62 @@ def load_txt(path: Path) -> str:
     return path.read_text(encoding="utf-8", errors="ignore")
 
 
+def _last_token_safe_cut(text: str) -> int:
+    """Index of the last space that follows a non-space character (0 if there is none)."""
+    i = text.rfind(" ")
+    while i > 0 and text[i - 1].isspace():
+        i = text.rfind(" ", 0, i)
+    return max(i, 0)
+
+
+def _fadvise(fd: int, advice_name: str) -> None:
+    """posix_fadvise a whole file; a no-op where the OS doesn't support it (macOS, Windows)."""
+    advice = getattr(os, advice_name, None)
+    if advice is not None and hasattr(os, "posix_fadvise"):
+        try:
+            os.posix_fadvise(fd, 0, 0, advice)
+        except OSError:
+            pass
+
+
+def prefetch_file(path: Path) -> None:
+    """
+    Ask the kernel to start reading a file into the page cache in the background.
+
+    Returns immediately; the read that follows (next filing in the queue) then hits
+    cache instead of stalling on disk.
+    """
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        _fadvise(fd, "POSIX_FADV_WILLNEED")
+    finally:
+        os.close(fd)
+
+
+def iter_text_windows(path: Path, window_chars: int = TEXT_WINDOW_CHARS) -> Iterator[str]:
+    """
+    Read a file in consecutive ~window_chars pieces instead of one str.
+
+    Pieces are only split right before a space that follows a non-space character:
+    cl100k_base never merges tokens across that point, so tokenizing the pieces one
+    by one yields exactly the tokens of the whole text (no overlap to dedupe).
+    """
+    with path.open(encoding="utf-8", errors="ignore") as f:
+        _fadvise(f.fileno(), "POSIX_FADV_SEQUENTIAL")  # larger kernel readahead
+        carry = ""
+        while piece := f.read(window_chars):
+            text = carry + piece
+            cut = _last_token_safe_cut(text)
+            if cut:
+                yield text[:cut]
+            carry = text[cut:]
+        if carry:
+            yield carry
+
+
 def find_filing_txt_files() -> list[tuple[Path, str]]:
     """
     Find all full-submission.txt files in sec-edgar-filings.
@@ -73,6 +164,110 @@ def find_filing_txt_files() -> list[tuple[Path, str]]:
     return results
 
 
+_encoding = None
+
+
+def _get_encoding() -> tiktoken.Encoding:
+    """Lazy-load and cache the cl100k_base encoding (building it takes tens of ms)."""
+    global _encoding
+    if _encoding is None:
+        _encoding = tiktoken.get_encoding("cl100k_base")
+    return _encoding
+
+
+_token_memo: OrderedDict[str, array] = OrderedDict()
+
+
+def tokenize_cached(text: str, memo: bool = True) -> array:
+    """
+    Tokenize text with cl100k_base, memoized by a blake2b hash of the content.
+
+    Lookups go through a bounded in-memory LRU first (unless memo=False), then (for
+    long texts) TOKEN_CACHE_DIR on disk. Returns token ids as array('i').
+    """
+    digest = hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+    tokens = _token_memo.get(digest) if memo else None
+    if tokens is not None:
+        _token_memo.move_to_end(digest)
+        return tokens
+
+    use_disk = TOKEN_CACHE_DIR is not None and len(text) >= TOKEN_CACHE_MIN_CHARS
+    cache_file = TOKEN_CACHE_DIR / _get_encoding().name / f"{digest}.bin" if use_disk else None
+    if cache_file is not None and cache_file.exists():
+        tokens = array("i")
+        tokens.frombytes(cache_file.read_bytes())
+    else:
+        # encode_ordinary: filing text is plain text, so skip the special-token scan (and
+        # don't raise on a literal "<|endoftext|>" in a filing)
+        tokens = array("i", _get_encoding().encode_ordinary(text))
+        if cache_file is not None:
+            cache_file.parent.mkdir(parents=True, exist_ok=True)
+            tmp_file = cache_file.with_suffix(f".{os.getpid()}.tmp")
+            tmp_file.write_bytes(tokens.tobytes())
+            os.replace(tmp_file, cache_file)
+
+    if memo:
+        _token_memo[digest] = tokens
+        if len(_token_memo) > TOKEN_MEMO_SIZE:
+            _token_memo.popitem(last=False)
+    return tokens
+
+
+def _iter_token_windows(
+    token_blocks: Iterable[array], chunk_size: int, overlap: int
+) -> Iterator[array]:
+    """Slide chunk_size-token windows (stride chunk_size - overlap) over consecutive blocks."""
+    stride = chunk_size - overlap
+    tokens = array("i")
+    for block in token_blocks:
+        tokens.extend(block)
+        start = 0
+        while start + chunk_size <= len(tokens):
+            yield tokens[start : start + chunk_size]
+            start += stride
+        del tokens[:start]  # keep only what later windows still need
+    for start in range(0, len(tokens), stride):
+        yield tokens[start : start + chunk_size]
+
+
+def _decode_windows(windows: Iterable[array]) -> Iterator[str]:
+    """
+    Decode token windows one at a time as they are produced, skipping whitespace-only chunks.
+
+    Plain encoding.decode per window: decode_batch only maps decode over a fresh
+    8-thread pool per call, which is slower here.
+    """
+    encoding = _get_encoding()
+    for window in windows:
+        chunk = encoding.decode(window)
+        if chunk.strip():
+            yield chunk
+
+
+def iter_chunks_with_overlap(text: str, chunk_size: int, overlap: int) -> Iterator[str]:
+    """
+    Yield the chunks of chunk_with_overlap() one at a time.
+
+    Windows are sliced and decoded lazily (_iter_token_windows and _decode_windows are
+    generators), so only the chunk being consumed is held, never all of a text's chunks.
+    """
+    yield from _decode_windows(_iter_token_windows([tokenize_cached(text)], chunk_size, overlap))
+
+
+def iter_file_chunks(path: Path, chunk_size: int, overlap: int) -> Iterator[str]:
+    """
+    Same chunks as chunk_with_overlap(load_txt(path), ...), without loading the whole file.
+
+    The file is tokenized one iter_text_windows() piece at a time; only the tokens a
+    pending window still needs are kept between pieces. Pieces skip the in-memory memo
+    (an ingest never tokenizes the same piece twice) and only use the disk cache.
+    """
+    token_blocks = (
+        tokenize_cached(text, memo=False) for text in iter_text_windows(path, TEXT_WINDOW_CHARS)
+    )
+    yield from _decode_windows(_iter_token_windows(token_blocks, chunk_size, overlap))
+
+
 def chunk_with_overlap(text: str, chunk_size: int, overlap: int) -> list[str]:
     """
     Split text into chunks by tokens, with overlap.
@@ -81,32 +276,18 @@ def chunk_with_overlap(text: str, chunk_size: int, overlap: int) -> list[str]:
     Sliding window: stride = chunk_size - overlap. Each chunk shares `overlap`
     tokens with the previous one to avoid cutting sentences.
     """
-    encoding = tiktoken.get_encoding("cl100k_base")
-    tokens = encoding.encode(text)
-    chunks = []
-    start = 0
-    stride = chunk_size - overlap
+    return list(iter_chunks_with_overlap(text, chunk_size, overlap))
 
-    while start < len(tokens):
-        end = min(start + chunk_size, len(tokens))
-        chunk_tokens = tokens[start:end]
-        chunk_text = encoding.decode(chunk_tokens)
-        if chunk_text.strip():
-            chunks.append(chunk_text)
-        start += stride
-        if start >= len(tokens):
-            break
 
-    return chunks
-
-
-def embed_chunks(chunks: list[str]) -> list[list[float]]:
-    """Embed chunks using SentenceTransformers."""
-    from sentence_transformers import SentenceTransformer
+def embed_chunks(chunks: list[str]) -> np.ndarray:
+    """
+    Embed chunks using SentenceTransformers.
 
-    model = SentenceTransformer("all-MiniLM-L6-v2")
-    embeddings = model.encode(chunks, show_progress_bar=True)
-    return embeddings.tolist()
+    Returns a (len(chunks), dim) array of unit-norm vectors, so cosine distance
+    on the stored embeddings stays correct. Chunks seen by an earlier ingest come
+    from the embedding cache instead of the model.
+    """
+    return embed_texts(chunks, show_progress_bar=True)
 
 
 def get_embedding_dim() -> int:
@@ -114,11 +295,49 @@ def get_embedding_dim() -> int:
     return 384
 
 
+@functools.lru_cache(maxsize=8)
+def _vector_format(dim: int) -> str:
+    """printf template for a dim-long vector in pgvector's text form."""
+    # 5 significant digits round-trip any fp16 value exactly (halfvec storage)
+    return "[" + ",".join(["%.5g"] * dim) + "]"
+
+
+def _format_copy_row(content: str, embedding, ticker: str, source: str) -> str:
+    """
+    Format one documents row for COPY ... WITH (FORMAT TEXT).
+
+    Fields are tab-separated; the embedding uses pgvector's text form "[0.1,0.2,...]".
+    The vector is formatted in one %-operation over Python floats, about twice as fast
+    as str() on each numpy scalar.
+    """
+    values = embedding.tolist() if isinstance(embedding, np.ndarray) else embedding
+    vector_text = _vector_format(len(values)) % tuple(values)
+    fields = (
+        content.translate(_COPY_ESCAPES),
+        vector_text,
+        ticker.translate(_COPY_ESCAPES),
+        source.translate(_COPY_ESCAPES),
+    )
+    return "\t".join(fields) + "\n"
+
+
 def init_pgvector(conn):
-    """Create extension and table if not exist."""
+    """
+    Create extension and table if not exist.
+
+    Embeddings are stored as halfvec (fp16, pgvector 0.7+): half the bytes of
+    vector per row, so scans and indexes move half the data. Tables created
+    with the older vector column are converted in place.
+
+    Invariant: every stored embedding is unit-norm (embed_texts normalizes, up to
+    fp16 rounding). retrieve_context relies on it to rank by inner product (<#>,
+    halfvec_ip_ops index), which then orders exactly like cosine distance without
+    per-row norms. Rows written by another embedder must be normalized too.
+    """
     from pgvector.psycopg2 import register_vector
 
     register_vector(conn)
+    dim = get_embedding_dim()
     cur = conn.cursor()
     cur.execute("CREATE EXTENSION IF NOT EXISTS vector")
     cur.execute(
@@ -126,12 +345,23 @@ def init_pgvector(conn):
         CREATE TABLE IF NOT EXISTS documents (
             id bigserial PRIMARY KEY,
             content text NOT NULL,
-            embedding vector({get_embedding_dim()}),
+            embedding halfvec({dim}),
             ticker text,
             source text
         )
         """
     )
+    cur.execute(
+        """
+        SELECT format_type(atttypid, atttypmod)
+        FROM pg_attribute
+        WHERE attrelid = 'documents'::regclass AND attname = 'embedding'
+        """
+    )
+    (column_type,) = cur.fetchone()
+    if column_type != f"halfvec({dim})":
+        logger.info("migrating_embedding_column", from_type=column_type, to_type=f"halfvec({dim})")
+        cur.execute(f"ALTER TABLE documents ALTER COLUMN embedding TYPE halfvec({dim})")
     cur.close()
     conn.commit()
 
@@ -139,33 +369,146 @@ def init_pgvector(conn):
 @retry_db
 def store_in_pgvector(
     chunks: list[str],
-    embeddings: list[list[float]],
+    embeddings: np.ndarray,
     ticker: str,
     source: str,
 ) -> None:
-    """Store chunks and embeddings in pgvector."""
-    import numpy as np
-    import psycopg2
+    """
+    Store chunks and embeddings in pgvector.
 
-    conn = psycopg2.connect(DATABASE_URL)
-    init_pgvector(conn)
+    Uses COPY FROM STDIN instead of one INSERT per chunk: rows are streamed in
+    batches of COPY_BATCH_ROWS and committed once per call, so a retry never
+    duplicates or half-stores this call's rows. ingest_all stores a large filing
+    over several calls (one per EMBED_FLUSH_ROWS flush), so an aborted ingest can
+    still leave a filing partially stored.
+    """
+    # Stored as halfvec: sending fp16 values keeps the COPY text short and exact
+    embeddings = np.asarray(embeddings, dtype=np.float16)
+
+    with pooled_connection() as conn:
+        init_pgvector(conn)
+        cur = conn.cursor()
+        for start in range(0, len(chunks), COPY_BATCH_ROWS):
+            end = start + COPY_BATCH_ROWS
+            buf = io.StringIO()
+            for content, embedding in zip(chunks[start:end], embeddings[start:end]):
+                buf.write(_format_copy_row(content, embedding, ticker, source))
+            buf.seek(0)
+            cur.copy_expert(COPY_SQL, buf)
+        conn.commit()
+        cur.close()
+
+
+def _iter_filing_pieces(files: list[tuple[Path, str]]) -> Iterator[tuple[Path, str, str]]:
+    """(path, ticker, text piece) for every filing in order; the next filing is prefetched."""
+    for i, (path, ticker) in enumerate(files):
+        if i + 1 < len(files):
+            prefetch_file(files[i + 1][0])  # read the next filing while this one chunks
+        logger.info("loading", ticker=ticker, bytes=path.stat().st_size)
+        for piece in iter_text_windows(path, TEXT_WINDOW_CHARS):
+            yield path, ticker, piece
+
+
+def _tokenize_pieces(
+    pieces: Iterable[tuple[Path, str, str]], workers: int
+) -> Iterator[tuple[Path, str, array]]:
+    """
+    tokenize_cached() each piece, in input order, with `workers` worker processes.
 
-    cur = conn.cursor()
-    for content, embedding in zip(chunks, embeddings):
+    At most 2 * workers pieces are in flight, so memory is bounded by the piece
+    size (TEXT_WINDOW_CHARS), not the filing size.
+    """
+    if workers <= 1:
+        for path, ticker, piece in pieces:
+            yield path, ticker, tokenize_cached(piece, memo=False)
+        return
+
+    with ProcessPoolExecutor(workers) as executor:
+        pending = deque()
+        for path, ticker, piece in pieces:
+            pending.append((path, ticker, executor.submit(tokenize_cached, piece, False)))
+            if len(pending) >= 2 * workers:
+                path, ticker, future = pending.popleft()
+                yield path, ticker, future.result()
+        while pending:
+            path, ticker, future = pending.popleft()
+            yield path, ticker, future.result()
+
+
+def _iter_chunked_filings(
+    files: list[tuple[Path, str]],
+) -> Iterator[tuple[str, str, Iterator[str]]]:
+    """
+    Yield (ticker, source, chunks) per filing, in order; consume each before the next.
+
+    Tokenization (BPE, the CPU-heavy part) runs in worker processes one
+    iter_text_windows() piece at a time, so a large filing spreads across all workers
+    and no worker ever holds a whole filing or its chunk list. The main process
+    slides the chunk windows and decodes them lazily. Embedding and DB writes stay in
+    the main process: one model instance already uses every core, and connections
+    don't fork cleanly.
+    """
+    workers = max((os.cpu_count() or 1) - 1, 1)
+    blocks = _tokenize_pieces(_iter_filing_pieces(files), workers)
+    for (path, ticker), group in groupby(blocks, key=lambda block: block[:2]):
+        token_blocks = (tokens for _, _, tokens in group)
+        windows = _iter_token_windows(token_blocks, CHUNK_SIZE_TOKENS, CHUNK_OVERLAP_TOKENS)
+        yield ticker, str(path), _decode_windows(windows)
+
+
+def _flush_chunks(batch: list[tuple[str, str, str]]) -> None:
+    """Embed a batch of (ticker, source, chunk) rows in one call, then store it per filing."""
+    embeddings = embed_chunks([chunk for _, _, chunk in batch])
+    logger.info("embedded", count=len(embeddings))
+
+    start = 0
+    for (ticker, source), rows in groupby(batch, key=lambda row: row[:2]):
+        end = start + len(list(rows))
+        store_in_pgvector(
+            chunks=[chunk for _, _, chunk in batch[start:end]],
+            embeddings=embeddings[start:end],
+            ticker=ticker,
+            source=source,
+        )
+        logger.info("stored", ticker=ticker, count=end - start)
+        start = end
+
+
+@retry_db
+def create_indexes() -> None:
+    """
+    Build the HNSW index (inner product) and the ticker index, then refresh planner stats.
+
+    Without the HNSW index every retrieval is a sequential scan + sort over all
+    chunks; the btree on ticker serves the WHERE ticker = %s path. Embeddings are
+    unit-norm, so inner product ranks like cosine with fewer FLOPs per distance.
+    """
+    with pooled_connection() as conn:
+        cur = conn.cursor()
+        # Superseded cosine index; retrieval orders by <#> now
+        cur.execute("DROP INDEX IF EXISTS documents_embedding_hnsw")
         cur.execute(
+            f"""
+            CREATE INDEX IF NOT EXISTS documents_embedding_ip_hnsw
+            ON documents USING hnsw (embedding halfvec_ip_ops)
+            WITH (m = {HNSW_M}, ef_construction = {HNSW_EF_CONSTRUCTION})
             """
-            INSERT INTO documents (content, embedding, ticker, source)
-            VALUES (%s, %s, %s, %s)
-            """,
-            (content, np.array(embedding), ticker, source),
         )
-    conn.commit()
-    cur.close()
-    conn.close()
+        cur.execute("CREATE INDEX IF NOT EXISTS documents_ticker_idx ON documents (ticker)")
+        cur.execute("ANALYZE documents")
+        conn.commit()
+        cur.close()
 
 
 def ingest_all():
-    """Load filings, chunk, embed, and store in pgvector."""
+    """
+    Load filings, chunk, embed, and store in pgvector.
+
+    Filings are tokenized in TEXT_WINDOW_CHARS pieces (a bounded number in flight)
+    and chunks stream through a rolling buffer of EMBED_FLUSH_ROWS (spanning filing
+    boundaries) that is embedded in one call and COPY'd per filing, so peak memory is
+    independent of both filing size and corpus size.
+    """
     files = find_filing_txt_files()
     if not files:
         logger.warning("no_filings_found", hint="Run python scripts/download_financial_docs.py")
@@ -173,31 +516,33 @@ def ingest_all():
 
     logger.info("ingest_start", filings_count=len(files))
 
-    for path, ticker in files:
-        logger.info("processing_ticker", ticker=ticker)
-        text = load_txt(path)
-        logger.info("loaded", ticker=ticker, chars=len(text))
-
-        chunks = chunk_with_overlap(
-            text,
-            chunk_size=CHUNK_SIZE_TOKENS,
-            overlap=CHUNK_OVERLAP_TOKENS,
-        )
-        logger.info("chunked", ticker=ticker, chunks=len(chunks))
-
-        embeddings = embed_chunks(chunks)
-        logger.info("embedded", ticker=ticker, count=len(embeddings))
+    batch = []  # (ticker, source, chunk)
+    total = 0
+    for ticker, source, chunks in _iter_chunked_filings(files):
+        count = 0
+        for chunk in chunks:
+            batch.append((ticker, source, chunk))
+            count += 1
+            if len(batch) >= EMBED_FLUSH_ROWS:
+                _flush_chunks(batch)
+                batch = []
+        logger.info("chunked", ticker=ticker, chunks=count)
+        total += count
+    if batch:
+        _flush_chunks(batch)
+
+    if not total:
+        logger.warning("no_chunks_found")
+        return
 
-        store_in_pgvector(
-            chunks=chunks,
-            embeddings=embeddings,
-            ticker=ticker,
-            source=str(path),
-        )
-        logger.info("stored", ticker=ticker)
+    create_indexes()
+    logger.info("indexed")
 
     logger.info("ingest_complete")
 
 
 if __name__ == "__main__":
-    ingest_all()
+    try:
+        ingest_all()
+    finally:
+        close_pool()
@@ -4,6 +4,7 @@ Structured logging setup for tiny_rag.
 Configure once at startup, then use: from tiny_rag.logging_config import get_logger
 
 Env: LOG_FORMAT=json for JSON output (production), default is pretty console.
+       JSON lines are rendered with orjson when it is installed, else the stdlib json.
      LOG_LEVEL=INFO|DEBUG|WARNING|ERROR
 """
 
@@ -23,10 +24,22 @@ def _configure_structlog() -> None:
         structlog.processors.StackInfoRenderer(),
     ]
 
+    logger_factory = structlog.PrintLoggerFactory()
     if log_format == "json":
+        try:
+            import orjson
+        except ImportError:
+            orjson = None
+
+        if orjson is not None:
+            # orjson renders bytes, written straight to stdout's buffer (no str encode + print)
+            renderer = structlog.processors.JSONRenderer(serializer=orjson.dumps)
+            logger_factory = structlog.BytesLoggerFactory()
+        else:
+            renderer = structlog.processors.JSONRenderer()
         processors = shared_processors + [
             structlog.processors.format_exc_info,
-            structlog.processors.JSONRenderer(),
+            renderer,
         ]
     else:
         processors = shared_processors + [
@@ -36,7 +49,7 @@ def _configure_structlog() -> None:
     structlog.configure(
         processors=processors,
         context_class=dict,
-        logger_factory=structlog.PrintLoggerFactory(),
+        logger_factory=logger_factory,
         cache_logger_on_first_use=True,
     )
 
@@ -8,11 +8,23 @@ GUIDE:
 3. build_rag_prompt(query, contexts) → Format context + question + citation instructions
 4. call_ollama(prompt) → Send to Ollama llama3.2, get response
 5. answer_with_rag() → Orchestrates all above, returns {answer, sources}
+   - answer_with_rag_async(): same pipeline for concurrent callers (eval); retrieval runs
+     in a worker thread, the LLM call uses ollama.AsyncClient
+   - answer_batch_with_rag_async(): several questions per JSON-format call, split into
+     sub-batches that fit OLLAMA_BATCH_NUM_CTX (build_batched_rag_prompt /
+     parse_batched_answers), per-question fallback
 
 Run: python -m tiny_rag.rag "What are Alphabet's main risks?"
 Requires: Ollama running with llama3.2, ingested data
 """
 
+import asyncio
+import contextlib
+import functools
+import json
+import os
+import re
+
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -23,16 +35,33 @@ from .retry_config import retry_ollama
 
 logger = get_logger(__name__)
 
+# Pinned context window: a stable per-request KV-cache size lets Ollama run concurrent
+# requests (OLLAMA_NUM_PARALLEL) without reloading. 8192 fits k=20 chunks of 400 tokens.
+OLLAMA_NUM_CTX = int(os.getenv("OLLAMA_NUM_CTX", "8192"))
+# How long Ollama keeps the model loaded after a request (avoids cold reloads between calls)
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "1h")
+# Context window for batched eval prompts (answer_batch_with_rag_async): several
+# questions' contexts share one prompt. llama3.2 supports far more; KV-cache memory
+# grows with it (times OLLAMA_NUM_PARALLEL). 16384 fits 2-3 questions at k=6.
+OLLAMA_BATCH_NUM_CTX = int(os.getenv("OLLAMA_BATCH_NUM_CTX", "16384"))
+# Rough chars-per-token, to size a batched prompt against its num_ctx without a tokenizer
+CHARS_PER_TOKEN = 4
 
-def build_rag_prompt(query: str, contexts: list[dict]) -> str:
-    """Build prompt with retrieved context and citation instructions."""
+
+def _format_context_block(contexts: list[dict]) -> str:
+    """Numbered context chunks ([1] (TICKER) ...) for citation."""
     context_parts = []
     for i, ctx in enumerate(contexts, 1):
         content = ctx["content"].strip()
         ticker = ctx.get("ticker", "?")
         context_parts.append(f"[{i}] ({ticker})\n{content}")
 
-    context_block = "\n\n---\n\n".join(context_parts)
+    return "\n\n---\n\n".join(context_parts)
+
+
+def build_rag_prompt(query: str, contexts: list[dict]) -> str:
+    """Build prompt with retrieved context and citation instructions."""
+    context_block = _format_context_block(contexts)
 
     return f"""Use the following context to answer the question. Cite sources with [1], [2], etc.
 
@@ -44,15 +73,105 @@ Question: {query}
 Answer (with citations):"""
 
 
+def build_batched_rag_prompt(items: list[tuple[str, list[dict]]]) -> str:
+    """
+    One prompt for several (query, contexts) items, answered together as JSON.
+
+    Each question carries its own numbered context; the reply is parsed back per question
+    by parse_batched_answers().
+    """
+    sections = [
+        f"### Question {i}: {query}\n\nContext:\n{_format_context_block(contexts)}"
+        for i, (query, contexts) in enumerate(items, 1)
+    ]
+    body = "\n\n===\n\n".join(sections)
+
+    return f"""Answer each question using only the context given under it. Cite sources with [1], [2], etc., numbered within that question's context.
+
+Respond as JSON with one entry per question, in this schema:
+{{"answers": [{{"id": 1, "answer": "..."}}, {{"id": 2, "answer": "..."}}]}}
+
+{body}
+
+JSON:"""
+
+
+def parse_batched_answers(text: str, n: int) -> list[str] | None:
+    """Answers 1..n from a batched JSON reply, in order; None if malformed or incomplete."""
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError:
+        return None
+    entries = data.get("answers") if isinstance(data, dict) else data
+    if not isinstance(entries, list):
+        return None
+    by_id = {}
+    for entry in entries:
+        if isinstance(entry, dict) and isinstance(entry.get("answer"), str):
+            by_id[entry.get("id")] = entry["answer"]
+    if set(by_id) != set(range(1, n + 1)):
+        return None
+    return [by_id[i] for i in range(1, n + 1)]
+
+
 @retry_ollama
 def call_ollama(prompt: str, model: str = "llama3.2") -> str:
     """Call Ollama LLM and return the response text."""
     import ollama
 
-    response = ollama.chat(model=model, messages=[{"role": "user", "content": prompt}])
+    response = ollama.chat(
+        model=model,
+        messages=[{"role": "user", "content": prompt}],
+        options={"num_ctx": OLLAMA_NUM_CTX},
+        keep_alive=OLLAMA_KEEP_ALIVE,
+    )
     return response["message"]["content"]
 
 
+@retry_ollama
+async def call_ollama_async(
+    prompt: str,
+    model: str = "llama3.2",
+    client=None,
+    format: str | None = None,
+    num_ctx: int | None = None,
+) -> str:
+    """
+    Async call_ollama. Pass a shared ollama.AsyncClient to reuse its connections;
+    without one, a client is opened and closed for this call.
+
+    format="json" constrains the reply to JSON; num_ctx defaults to OLLAMA_NUM_CTX.
+    """
+    import ollama
+
+    async with contextlib.nullcontext(client) if client else ollama.AsyncClient() as client:
+        response = await client.chat(
+            model=model,
+            messages=[{"role": "user", "content": prompt}],
+            format=format,
+            options={"num_ctx": num_ctx or OLLAMA_NUM_CTX},
+            keep_alive=OLLAMA_KEEP_ALIVE,
+        )
+    return response["message"]["content"]
+
+
+def make_async_ollama_client(max_connections: int):
+    """AsyncClient whose HTTP pool keeps `max_connections` connections alive for reuse."""
+    import httpx
+    import ollama
+
+    return ollama.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=max_connections, max_keepalive_connections=max_connections
+        )
+    )
+
+
+def _format_sources(contexts: list[dict]) -> list[dict]:
+    """Short source previews returned alongside the answer."""
+    return [{"ticker": c["ticker"], "content": c["content"][:200] + "..."} for c in contexts]
+
+
 def answer_with_rag(query: str, k: int = 5, ticker: str | None = None) -> dict:
     """
     Retrieve context, call LLM, return answer with citations.
@@ -65,12 +184,105 @@ def answer_with_rag(query: str, k: int = 5, ticker: str | None = None) -> dict:
     prompt = build_rag_prompt(query, contexts)
     answer = call_ollama(prompt)
 
-    return {
-        "answer": answer,
-        "sources": [
-            {"ticker": c["ticker"], "content": c["content"][:200] + "..."} for c in contexts
-        ],
-    }
+    return {"answer": answer, "sources": _format_sources(contexts)}
+
+
+async def answer_with_rag_async(
+    query: str,
+    k: int = 5,
+    ticker: str | None = None,
+    client=None,
+    llm_slots: asyncio.Semaphore | None = None,
+) -> dict:
+    """
+    Async answer_with_rag, so many questions can wait on Postgres/Ollama at once.
+
+    Retrieval (embedding + pooled psycopg2 query) runs via asyncio.to_thread;
+    generation awaits ollama.AsyncClient. If llm_slots is given, only the Ollama call
+    waits for a slot: retrieval for the next questions overlaps the current generations.
+    Returns the same dict as answer_with_rag.
+    """
+    contexts = await asyncio.to_thread(retrieve_context, query, k=k, ticker=ticker)
+    if not contexts:
+        return {"answer": "No relevant context found.", "sources": []}
+
+    prompt = build_rag_prompt(query, contexts)
+    async with llm_slots or contextlib.nullcontext():
+        answer = await call_ollama_async(prompt, client=client)
+
+    return {"answer": answer, "sources": _format_sources(contexts)}
+
+
+def _split_batch(items: list[tuple[str, list[dict]]], max_tokens: int) -> list[list[int]]:
+    """Greedily group consecutive items so each group's batched prompt fits max_tokens."""
+    groups: list[list[int]] = []
+    for i in range(len(items)):
+        if groups:
+            candidate = groups[-1] + [i]
+            prompt = build_batched_rag_prompt([items[j] for j in candidate])
+            if len(prompt) // CHARS_PER_TOKEN <= max_tokens:
+                groups[-1] = candidate
+                continue
+        groups.append([i])
+    return groups
+
+
+async def answer_batch_with_rag_async(
+    queries: list[str],
+    tickers: list[str | None],
+    k: int = 5,
+    client=None,
+    llm_slots: asyncio.Semaphore | None = None,
+) -> list[dict]:
+    """
+    answer_with_rag_async for several questions, generated by as few Ollama calls as fit.
+
+    Retrieval runs concurrently; the questions with context are split into consecutive
+    sub-batches whose JSON-format prompt fits half of OLLAMA_BATCH_NUM_CTX (leaving
+    room for the answers), one call each. Questions left alone in a sub-batch, or in
+    one whose reply doesn't parse into one answer per question, get their own call.
+    Every call here uses OLLAMA_BATCH_NUM_CTX so Ollama doesn't reload between them.
+    Returns answer_with_rag dicts in input order.
+    """
+    contexts_list = await asyncio.gather(
+        *[asyncio.to_thread(retrieve_context, q, k=k, ticker=t) for q, t in zip(queries, tickers)]
+    )
+    answers: list[str | None] = [
+        None if contexts else "No relevant context found." for contexts in contexts_list
+    ]
+    todo = [i for i, contexts in enumerate(contexts_list) if contexts]
+    items = [(queries[i], contexts_list[i]) for i in todo]
+    groups = [[todo[j] for j in group] for group in _split_batch(items, OLLAMA_BATCH_NUM_CTX // 2)]
+    if len(groups) > 1:
+        logger.info("batch_split", questions=len(todo), batches=len(groups))
+
+    async def _answer_group(group: list[int]) -> None:
+        prompt = build_batched_rag_prompt([(queries[i], contexts_list[i]) for i in group])
+        async with llm_slots or contextlib.nullcontext():
+            reply = await call_ollama_async(
+                prompt, client=client, format="json", num_ctx=OLLAMA_BATCH_NUM_CTX
+            )
+        batched = parse_batched_answers(reply, len(group))
+        if batched is None:
+            logger.warning("batch_reply_unparsed", questions=len(group))
+            return
+        for i, answer in zip(group, batched):
+            answers[i] = answer
+
+    async def _answer_single(i: int) -> None:
+        prompt = build_rag_prompt(queries[i], contexts_list[i])
+        async with llm_slots or contextlib.nullcontext():
+            answers[i] = await call_ollama_async(
+                prompt, client=client, num_ctx=OLLAMA_BATCH_NUM_CTX
+            )
+
+    await asyncio.gather(*[_answer_group(group) for group in groups if len(group) > 1])
+    await asyncio.gather(*[_answer_single(i) for i in todo if answers[i] is None])
+
+    return [
+        {"answer": answer, "sources": _format_sources(contexts)}
+        for answer, contexts in zip(answers, contexts_list)
+    ]
 
 
 # Map company names (lowercase) to ticker symbols for focused retrieval.
@@ -87,13 +299,21 @@ TICKER_MAP = {
 }
 
 
+# One compiled pass over the query; word boundaries keep e.g. "metadata" from matching "meta"
+_TICKER_RE = re.compile(
+    r"\b(" + "|".join(map(re.escape, sorted(TICKER_MAP, key=len, reverse=True))) + r")\b",
+    re.IGNORECASE,
+)
+
+
+@functools.lru_cache(maxsize=1024)
 def infer_ticker_from_query(query: str) -> str | None:
-    """Infer ticker from query text if a known company is mentioned."""
-    q = query.lower()
-    for name, ticker in TICKER_MAP.items():
-        if name in q:
-            return ticker
-    return None
+    """Infer ticker from query text if a known company is mentioned (first mention wins).
+
+    Memoized: eval sweeps and repeated API questions resolve each query once.
+    """
+    match = _TICKER_RE.search(query)
+    return TICKER_MAP[match.group(1).lower()] if match else None
 
 
 if __name__ == "__main__":
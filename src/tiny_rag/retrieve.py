@@ -3,50 +3,123 @@ Retrieve relevant chunks from pgvector for a query.
 
 GUIDE:
 ------
-1. embed_query(query)       → Embeds query with SentenceTransformer (cached after first call)
-2. retrieve_context(query, k, ticker) → SELECT top-k chunks by vector similarity (<=>)
-   - If ticker given: WHERE ticker = X (focused retrieval)
-   - Order by embedding <=> query_embedding (cosine distance, smaller = more similar)
+1. embed_query(query)       → Embeds query with SentenceTransformer (model and per-query LRU cached,
+                               backed by the on-disk embedding cache)
+2. retrieve_context(query, k, ticker) → SELECT top-k chunks by vector similarity (<#>)
+   - If ticker given: WHERE ticker = X (focused retrieval), exact top-k over that ticker's rows
+   - Order by embedding <#> query_embedding (negative inner product, smaller = more similar);
+     stored and query embeddings are unit-norm, so this ranks exactly like cosine distance
+   - Embeddings are halfvec (fp16); the query vector is cast to halfvec by the prepared statement
+   - Runs PREPAREd statements on a connection from the shared pool (db.py); register_vector
+     and PREPARE run once per physical connection
+   - Uses the HNSW index built by ingest; hnsw.ef_search trades recall for speed
 
 Run: python -m tiny_rag.retrieve "What are Apple's main risk factors?"
 Requires: DATABASE_URL, ingested documents in pgvector
+Env: TINY_RAG_PREWARM=1 loads + warms the embedding model in a background thread at import
 """
 
-import logging
+import functools
 import os
+import sys
+import threading
+import weakref
+from contextlib import contextmanager
 
+import numpy as np
 from dotenv import load_dotenv
 
 load_dotenv()
 
+from .db import pooled_connection
+from .embeddings import embed_texts, get_embedding_model
+from .logging_config import get_logger
 from .retry_config import retry_db
 
-# Suppress SentenceTransformers BertModel load report (UNEXPECTED key warnings)
-logging.getLogger("sentence_transformers").setLevel(logging.WARNING)
+logger = get_logger(__name__)
 
-# Default: use current user (macOS/Homebrew) or postgres (Docker)
-_default_user = os.environ.get("USER", "postgres")
-DATABASE_URL = os.getenv(
-    "DATABASE_URL",
-    f"postgresql://{_default_user}@localhost:5432/rag_db",
+# HNSW candidate list size per query (pgvector default 40); must be >= k.
+# Raise for better recall, lower for speed.
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "40"))
+
+# Server-side prepared statements for the retrieval hot path (parsed/planned once)
+_PREPARE_STATEMENTS = (
+    """
+    PREPARE retrieve_all(halfvec, int) AS
+    SELECT content, ticker, source
+    FROM documents
+    ORDER BY embedding <#> $1
+    LIMIT $2
+    """,
+    # Filter first, then rank the ticker's rows exactly. Ordering by the HNSW index and
+    # filtering afterwards would only see ef_search candidates, most belonging to other
+    # tickers, and could return fewer than k rows. MATERIALIZED keeps Postgres from
+    # inlining the CTE back into that plan; the btree on ticker serves the filter.
+    """
+    PREPARE retrieve_by_ticker(text, halfvec, int) AS
+    WITH t AS MATERIALIZED (
+        SELECT embedding, content, ticker, source
+        FROM documents
+        WHERE ticker = $1
+    )
+    SELECT content, ticker, source
+    FROM t
+    ORDER BY embedding <#> $2
+    LIMIT $3
+    """,
 )
 
-_embedding_model = None
+# Repeated queries (eval replays, popular /ask questions) skip the forward pass
+QUERY_CACHE_SIZE = 4096
+
+
+@functools.lru_cache(maxsize=QUERY_CACHE_SIZE)
+def _embed_query_cached(query: str) -> np.ndarray:
+    """Embed a query once; the cached array is read-only so hits can't be mutated."""
+    embedding = embed_texts([query])[0]
+    embedding.setflags(write=False)
+    return embedding
+
+
+def embed_query(query: str) -> np.ndarray:
+    """Embed a single query string. Memoized per query; returns a private copy."""
+    return _embed_query_cached(query).copy()
 
 
-def _get_embedding_model():
-    """Lazy-load and cache the SentenceTransformer model."""
-    global _embedding_model
-    if _embedding_model is None:
-        from sentence_transformers import SentenceTransformer
+_prepared_conns = weakref.WeakSet()
 
-        _embedding_model = SentenceTransformer("all-MiniLM-L6-v2")
-    return _embedding_model
 
+def _prepare_connection(conn) -> None:
+    """Register the vector type, PREPARE retrieval statements, set ef_search (first checkout only)."""
+    if conn in _prepared_conns:
+        return
+
+    from pgvector.psycopg2 import register_vector
+
+    register_vector(conn)
+    cur = conn.cursor()
+    # PREPARE is not transactional: clear leftovers from an earlier failed attempt
+    cur.execute("DEALLOCATE ALL")
+    for statement in _PREPARE_STATEMENTS:
+        cur.execute(statement)
+    # Session-level, so it applies to every query on this connection without a SET per call
+    cur.execute(f"SET hnsw.ef_search = {HNSW_EF_SEARCH}")
+    cur.close()
+    conn.commit()
+    _prepared_conns.add(conn)
 
-def embed_query(query: str) -> list[float]:
-    """Embed a single query string."""
-    return _get_embedding_model().encode([query])[0].tolist()
+
+@contextmanager
+def _prepared_connection():
+    """Check out a pooled connection with the retrieval statements prepared."""
+    with pooled_connection() as conn:
+        _prepare_connection(conn)
+        yield conn
+
+
+def _intern(value: str | None) -> str | None:
+    """sys.intern for a column that may be NULL."""
+    return sys.intern(value) if value is not None else None
 
 
 @retry_db
@@ -54,54 +127,47 @@ def retrieve_context(query: str, k: int = 5, ticker: str | None = None) -> list[
     """
     Retrieve top-k most relevant chunks for a query.
 
-    Uses pgvector's <=> operator (cosine distance). Lower distance = more similar.
+    Uses pgvector's <#> operator (negative inner product; equals cosine ranking for
+    the unit-norm embeddings used here). Lower distance = more similar.
     If ticker is set, filters to that ticker only (e.g. GOOGL for Alphabet questions).
 
     Returns list of dicts: [{"content": str, "ticker": str, "source": str}, ...]
     """
-    import numpy as np
-    import psycopg2
-    from pgvector.psycopg2 import register_vector
+    from psycopg2.extras import RealDictCursor
 
     embedding = embed_query(query)
-    conn = psycopg2.connect(DATABASE_URL)
-    register_vector(conn)
+    with _prepared_connection() as conn:
+        # Rows come back as dicts keyed by column name; no second pass to rebuild them
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+        if ticker:
+            cur.execute("EXECUTE retrieve_by_ticker(%s, %s, %s)", (ticker, embedding, k))
+        else:
+            cur.execute("EXECUTE retrieve_all(%s, %s)", (embedding, k))
+        rows = cur.fetchall()
+        cur.close()
 
-    cur = conn.cursor()
-    if ticker:
-        cur.execute(
-            """
-            SELECT content, ticker, source
-            FROM documents
-            WHERE ticker = %s
-            ORDER BY embedding <=> %s
-            LIMIT %s
-            """,
-            (ticker, np.array(embedding), k),
-        )
-    else:
-        cur.execute(
-            """
-            SELECT content, ticker, source
-            FROM documents
-            ORDER BY embedding <=> %s
-            LIMIT %s
-            """,
-            (np.array(embedding), k),
-        )
-    rows = cur.fetchall()
-    cur.close()
-    conn.close()
+    # A handful of tickers/filing paths repeat across every result: keep one str per value
+    for row in rows:
+        row["ticker"] = _intern(row["ticker"])
+        row["source"] = _intern(row["source"])
+    return rows
 
-    return [{"content": row[0], "ticker": row[1], "source": row[2]} for row in rows]
 
+def _prewarm() -> None:
+    """Load the embedding model and run one encode so the first query doesn't pay for it."""
+    try:
+        get_embedding_model().encode(["warmup"], convert_to_numpy=True, normalize_embeddings=True)
+        logger.info("embedding_model_prewarmed")
+    except Exception as e:
+        logger.warning("embedding_prewarm_failed", error=str(e))
 
-if __name__ == "__main__":
-    import sys
 
-    from .logging_config import get_logger
+# Off by default so imports (tests, scripts) stay cheap; set TINY_RAG_PREWARM=1 for the API
+if os.getenv("TINY_RAG_PREWARM") == "1":
+    threading.Thread(target=_prewarm, name="embedding-prewarm", daemon=True).start()
+
 
-    logger = get_logger(__name__)
+if __name__ == "__main__":
     query = sys.argv[1] if len(sys.argv) > 1 else "What are Apple's main risk factors?"
     results = retrieve_context(query, k=6)
     logger.info("retrieve_query", query=query, results=len(results))
@@ -5,9 +5,18 @@ Pytest fixtures for tiny_rag tests.
 import pytest
 from fastapi.testclient import TestClient
 
+from tiny_rag import embeddings
 from tiny_rag.api import app
 
 
+@pytest.fixture(autouse=True)
+def isolated_embedding_cache(tmp_path, monkeypatch):
+    """Point the on-disk embedding cache at a per-test directory."""
+    monkeypatch.setattr(embeddings, "EMBEDDING_CACHE_DIR", tmp_path / "emb_cache")
+    monkeypatch.setattr(embeddings, "_cache_conn", None)
+    monkeypatch.setattr(embeddings, "_cache_failed", False)
+
+
 @pytest.fixture
 def client():
     """FastAPI TestClient."""
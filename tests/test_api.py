@@ -11,6 +11,14 @@ from tiny_rag.api import app
 client = TestClient(app)
 
 
+class TestLifespan:
+    @patch("tiny_rag.api.close_pool")
+    def test_shutdown_closes_db_pool(self, mock_close):
+        with TestClient(app):
+            mock_close.assert_not_called()
+        mock_close.assert_called_once()
+
+
 class TestRoot:
     def test_returns_200(self):
         r = client.get("/")
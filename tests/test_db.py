@@ -0,0 +1,79 @@
+"""
+Unit tests for tiny_rag.db.
+"""
+
+import threading
+from unittest.mock import MagicMock
+
+import psycopg2
+import pytest
+from psycopg2.pool import PoolError
+
+from tiny_rag import db
+
+
+def fake_pool(max_conn: int = db.POOL_MAX_CONN):
+    """Pool that, like ThreadedConnectionPool, raises PoolError once exhausted."""
+    pool = MagicMock()
+    checked_out = []
+
+    def getconn():
+        if len(checked_out) >= max_conn:
+            raise PoolError("connection pool exhausted")
+        conn = MagicMock(closed=0)
+        checked_out.append(conn)
+        return conn
+
+    pool.getconn.side_effect = getconn
+    pool.putconn.side_effect = lambda conn, close=False: checked_out.remove(conn)
+    return pool
+
+
+class TestPooledConnection:
+    def test_connection_returned_for_reuse(self, monkeypatch):
+        pool = fake_pool()
+        monkeypatch.setattr(db, "_pool", pool)
+
+        with db.pooled_connection() as conn:
+            pass
+
+        pool.putconn.assert_called_once_with(conn, close=0)
+
+    def test_broken_connection_is_closed(self, monkeypatch):
+        pool = fake_pool()
+        monkeypatch.setattr(db, "_pool", pool)
+
+        with pytest.raises(psycopg2.OperationalError):
+            with db.pooled_connection() as conn:
+                raise psycopg2.OperationalError("server closed the connection")
+
+        pool.putconn.assert_called_once_with(conn, close=True)
+
+    def test_callers_wait_instead_of_exhausting_pool(self, monkeypatch):
+        monkeypatch.setattr(db, "_pool", fake_pool(max_conn=1))
+        monkeypatch.setattr(db, "_pool_slots", threading.BoundedSemaphore(1))
+        first_checked_out = threading.Event()
+        release_first = threading.Event()
+        order = []
+
+        def first():
+            with db.pooled_connection():
+                first_checked_out.set()
+                release_first.wait(timeout=5)
+                order.append("first released")
+
+        def second():
+            with db.pooled_connection():
+                order.append("second checked out")
+
+        threads = [threading.Thread(target=first), threading.Thread(target=second)]
+        threads[0].start()
+        first_checked_out.wait(timeout=5)
+        threads[1].start()
+        threads[1].join(timeout=0.1)
+        assert threads[1].is_alive()  # blocked on the semaphore, not raising PoolError
+        release_first.set()
+        for t in threads:
+            t.join(timeout=5)
+
+        assert order == ["first released", "second checked out"]
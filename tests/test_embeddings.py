@@ -0,0 +1,86 @@
+"""
+Unit tests for tiny_rag.embeddings.
+"""
+
+from unittest.mock import MagicMock
+
+import numpy as np
+
+from tiny_rag import embeddings
+
+
+def fake_model():
+    """Model whose encode returns one distinct unit vector per text."""
+    model = MagicMock()
+
+    def encode(texts, **kwargs):
+        return np.array([[len(t), 1.0] for t in texts]) / np.array(
+            [[np.hypot(len(t), 1.0)] for t in texts]
+        )
+
+    model.encode.side_effect = encode
+    return model
+
+
+class TestEmbedTexts:
+    def test_cached_texts_skip_the_model(self, monkeypatch):
+        model = fake_model()
+        monkeypatch.setattr(embeddings, "get_embedding_model", lambda: model)
+
+        first = embeddings.embed_texts(["alpha", "beta"])
+        monkeypatch.setattr(embeddings, "_cache_conn", None)  # reopen from disk
+        second = embeddings.embed_texts(["beta", "gamma", "alpha"])
+
+        assert model.encode.call_args_list[1].args[0] == ["gamma"]
+        assert second.dtype == np.float32
+        np.testing.assert_array_equal(second[[2, 0]], first)
+
+    def test_duplicates_encoded_once(self, monkeypatch):
+        model = fake_model()
+        monkeypatch.setattr(embeddings, "get_embedding_model", lambda: model)
+
+        vectors = embeddings.embed_texts(["same", "same", "other"])
+
+        assert model.encode.call_args.args[0] == ["same", "other"]
+        np.testing.assert_array_equal(vectors[0], vectors[1])
+
+    def test_works_with_cache_disabled(self, monkeypatch):
+        model = fake_model()
+        monkeypatch.setattr(embeddings, "get_embedding_model", lambda: model)
+        monkeypatch.setattr(embeddings, "EMBEDDING_CACHE_DIR", None)
+
+        embeddings.embed_texts(["alpha"])
+        embeddings.embed_texts(["alpha"])
+
+        assert model.encode.call_count == 2
+
+    def test_unusable_cache_dir_disables_cache(self, tmp_path, monkeypatch):
+        model = fake_model()
+        monkeypatch.setattr(embeddings, "get_embedding_model", lambda: model)
+        blocked = tmp_path / "not_a_dir"
+        blocked.write_text("")
+        monkeypatch.setattr(embeddings, "EMBEDDING_CACHE_DIR", blocked)
+
+        embeddings.embed_texts(["alpha"])
+        embeddings.embed_texts(["alpha"])
+
+        assert model.encode.call_count == 2
+        assert embeddings._cache_failed
+        assert embeddings.EMBEDDING_CACHE_DIR == blocked  # config left as set
+
+    def test_batch_size_follows_device(self, monkeypatch):
+        model = fake_model()
+        monkeypatch.setattr(embeddings, "get_embedding_model", lambda: model)
+
+        model.device.type = "cpu"
+        embeddings.embed_texts(["on cpu"])
+        model.device.type = "cuda"
+        embeddings.embed_texts(["on gpu"])
+        embeddings.embed_texts(["explicit"], batch_size=8)
+
+        sizes = [call.kwargs["batch_size"] for call in model.encode.call_args_list]
+        assert sizes == [
+            embeddings.EMBED_BATCH_SIZE_CPU,
+            embeddings.EMBED_BATCH_SIZE_ACCELERATOR,
+            8,
+        ]
@@ -0,0 +1,160 @@
+"""
+Unit tests for tiny_rag.eval.
+"""
+
+import asyncio
+import re
+import sys
+import zipfile
+from unittest.mock import patch
+
+import pytest
+
+from tiny_rag import eval as tiny_eval
+from tiny_rag.eval import match_keywords, run_eval, save_to_excel, save_to_parquet
+
+
+class TestMatchKeywords:
+    def test_case_insensitive_split(self):
+        found, missed = match_keywords("Azure Cloud revenue grew", ["cloud", "AZURE", "ads"])
+        assert found == ["cloud", "AZURE"]
+        assert missed == ["ads"]
+
+    def test_overlapping_keywords(self):
+        found, missed = match_keywords("Cloud revenue grew", ["cloud", "cloud revenue", "revenue"])
+        assert found == ["cloud", "cloud revenue", "revenue"]
+        assert missed == []
+
+    def test_regex_metacharacters_are_literal(self):
+        assert match_keywords("EPS was $1.50 (diluted)", ["$1.50", "1x50"]) == (["$1.50"], ["1x50"])
+
+    def test_no_keywords(self):
+        assert match_keywords("anything", []) == ([], [])
+
+    def test_ahocorasick_matches_regex_path(self, monkeypatch):
+        pytest.importorskip("ahocorasick")
+        keywords = ["cloud", "Cloud Revenue", "revenue", "$1.50", "ads", "", "cloud"]
+        answer = "Cloud revenue was $1.50 per share"
+        expected = match_keywords(answer, keywords)
+        monkeypatch.setattr(tiny_eval, "AHOCORASICK_MIN_KEYWORDS", 1)
+        assert match_keywords(answer, keywords) == expected
+
+    def test_falls_back_to_regex_without_ahocorasick(self, monkeypatch):
+        monkeypatch.setattr(tiny_eval, "AHOCORASICK_MIN_KEYWORDS", 1)
+        monkeypatch.setitem(sys.modules, "ahocorasick", None)  # import raises ImportError
+        assert match_keywords("Cloud revenue", ["cloud", "ads"]) == (["cloud"], ["ads"])
+
+
+class TestRunEval:
+    @patch("tiny_rag.eval.answer_with_rag_async")
+    def test_results_keep_input_order(self, mock_rag):
+        async def fake_rag(q, k, ticker, client, llm_slots):
+            # Later questions finish first
+            await asyncio.sleep(0.01 if q == "first" else 0)
+            return {"answer": f"answer to {q}", "sources": []}
+
+        mock_rag.side_effect = fake_rag
+        results = run_eval([{"q": "first"}, {"q": "second"}], concurrency=2)
+        assert [r["question"] for r in results] == ["first", "second"]
+
+    @patch("tiny_rag.eval.answer_with_rag_async")
+    def test_keyword_check(self, mock_rag):
+        async def fake_rag(q, k, ticker, client, llm_slots):
+            return {"answer": "Cloud revenue grew.", "sources": [{}]}
+
+        mock_rag.side_effect = fake_rag
+        results = run_eval(
+            [
+                {"q": "a", "expected_keywords": ["cloud", "Revenue"]},
+                {"q": "b", "expected_keywords": ["cloud", "ads"]},
+                {"q": "c"},
+            ]
+        )
+        assert [r["passed"] for r in results] == ["PASS", "FAIL", "N/A"]
+        assert results[1]["keywords_missed"] == "ads"
+        assert results[0]["sources_count"] == 1
+
+    @patch("tiny_rag.eval.answer_with_rag_async")
+    def test_failed_question_does_not_abort_run(self, mock_rag):
+        async def fake_rag(q, k, ticker, client, llm_slots):
+            if q == "bad":
+                raise ConnectionError("ollama down")
+            return {"answer": "ok", "sources": []}
+
+        mock_rag.side_effect = fake_rag
+        results = run_eval([{"q": "bad", "expected_keywords": ["x"]}, {"q": "good"}])
+        assert [r["passed"] for r in results] == ["ERROR", "N/A"]
+        assert results[0]["answer"] == "ERROR: ollama down"
+        assert results[0]["keywords_missed"] == "x"
+
+    @patch("tiny_rag.eval.answer_with_rag_async")
+    def test_retrieval_runs_ahead_of_generation(self, mock_rag):
+        events = []
+
+        async def fake_rag(q, k, ticker, client, llm_slots):
+            events.append(f"retrieved {q}")
+            async with llm_slots:
+                await asyncio.sleep(0.01)
+                events.append(f"generated {q}")
+            return {"answer": "", "sources": []}
+
+        mock_rag.side_effect = fake_rag
+        run_eval([{"q": "1"}, {"q": "2"}, {"q": "3"}], concurrency=1, prefetch=1)
+        # 2 is retrieved while 1 generates; 3 waits until 1 leaves the pipeline
+        assert events == [
+            "retrieved 1",
+            "retrieved 2",
+            "generated 1",
+            "retrieved 3",
+            "generated 2",
+            "generated 3",
+        ]
+
+    @patch("tiny_rag.eval.answer_batch_with_rag_async")
+    def test_batches_consecutive_questions(self, mock_batch):
+        async def fake_batch(queries, tickers, k, client, llm_slots):
+            return [{"answer": f"answer to {q}", "sources": []} for q in queries]
+
+        mock_batch.side_effect = fake_batch
+        results = run_eval([{"q": str(i)} for i in range(5)], batch_size=2)
+        assert [r["answer"] for r in results] == [f"answer to {i}" for i in range(5)]
+        assert [len(c.args[0]) for c in mock_batch.call_args_list] == [2, 2, 1]
+
+
+class TestSaveToExcel:
+    def test_every_column_written(self, tmp_path):
+        rows = [
+            {"question": "q1", "answer": "=SUM(A1)", "time_sec": None, "passed": "PASS"},
+            {"question": "q2", "answer": "plain", "time_sec": 1.5, "passed": "FAIL"},
+        ]
+        path = tmp_path / "results.xlsx"
+        save_to_excel(rows, path)
+
+        sheet = zipfile.ZipFile(path).read("xl/worksheets/sheet1.xml").decode()
+        cells = dict(re.findall(r'<c r="([A-Z]+\d+)"[^>]*>(?:<is><t>|<v>)([^<]*)<', sheet))
+        assert cells == {
+            "A1": "question",
+            "B1": "answer",
+            "C1": "time_sec",
+            "D1": "passed",
+            "A2": "q1",
+            "B2": "=SUM(A1)",
+            "D2": "PASS",  # None leaves C2 empty
+            "A3": "q2",
+            "B3": "plain",
+            "C3": "1.5",
+            "D3": "FAIL",
+        }
+        assert "<f>" not in sheet  # "=..." answers stay text, not formulas
+
+
+class TestSaveToParquet:
+    def test_round_trip(self, tmp_path):
+        pq = pytest.importorskip("pyarrow.parquet")
+        rows = [
+            {"question": "q1", "ticker": "AAPL", "time_sec": 1.5, "passed": "PASS"},
+            {"question": "q2", "ticker": None, "time_sec": None, "passed": "ERROR"},
+        ]
+        path = tmp_path / "results.parquet"
+        save_to_parquet(rows, path)
+        assert pq.read_table(path).to_pylist() == rows
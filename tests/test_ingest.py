@@ -2,7 +2,20 @@
 Unit tests for tiny_rag.ingest.
 """
 
-from tiny_rag.ingest import chunk_with_overlap, load_txt
+from unittest.mock import patch
+
+import numpy as np
+
+from tiny_rag import ingest
+from tiny_rag.ingest import (
+    _flush_chunks,
+    _format_copy_row,
+    chunk_with_overlap,
+    iter_file_chunks,
+    iter_text_windows,
+    load_txt,
+    tokenize_cached,
+)
 
 
 class TestChunkWithOverlap:
@@ -25,12 +38,41 @@ class TestChunkWithOverlap:
     def test_chunk_size_not_exceeded(self):
         text = "word " * 500
         chunks = chunk_with_overlap(text, chunk_size=50, overlap=10)
-        encoding = __import__("tiktoken").get_encoding("cl100k_base")
+        encoding = ingest._get_encoding()
         for c in chunks:
             tokens = encoding.encode(c)
             assert len(tokens) <= 55  # chunk_size + small variance
 
 
+class TestTokenizeCached:
+    def test_matches_encoding(self):
+        text = "Revenue grew 10% year over year."
+        assert list(tokenize_cached(text)) == ingest._get_encoding().encode(text)
+
+    def test_special_token_text_is_plain_text(self):
+        text = "Exhibit <|endoftext|> marker"
+        assert chunk_with_overlap(text, chunk_size=50, overlap=10) == [text]
+
+    def test_memoized_in_process(self):
+        text = "Memoized text for the token cache."
+        assert tokenize_cached(text) is tokenize_cached(text)
+
+    def test_memo_can_be_skipped(self):
+        text = "Text tokenized once per ingest."
+        assert tokenize_cached(text, memo=False) == tokenize_cached(text)
+        assert tokenize_cached(text, memo=False) is not tokenize_cached(text)
+
+    def test_round_trips_through_disk(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(ingest, "TOKEN_CACHE_DIR", tmp_path)
+        monkeypatch.setattr(ingest, "TOKEN_CACHE_MIN_CHARS", 0)
+        text = "Disk cached filing text."
+        tokens = tokenize_cached(text)
+        assert len(list(tmp_path.rglob("*.bin"))) == 1
+
+        ingest._token_memo.clear()
+        assert tokenize_cached(text) == tokens
+
+
 class TestLoadTxt:
     def test_loads_file(self, tmp_path):
         f = tmp_path / "test.txt"
@@ -42,3 +84,90 @@ class TestLoadTxt:
         f.write_bytes(b"Valid \xff invalid")
         result = load_txt(f)
         assert "Valid" in result
+
+
+class TestIterFileChunks:
+    TEXT = "Item 1A.  Risk Factors\n\nRevenue grew 12% in 2023; cloud   margins fell.\r\n" * 40
+
+    def test_windows_reassemble_file(self, tmp_path):
+        f = tmp_path / "filing.txt"
+        f.write_text(self.TEXT, encoding="utf-8")
+        windows = list(iter_text_windows(f, window_chars=64))
+        assert len(windows) > 1
+        assert "".join(windows) == load_txt(f)
+
+    def test_matches_whole_file_chunking(self, tmp_path, monkeypatch):
+        f = tmp_path / "filing.txt"
+        f.write_text(self.TEXT, encoding="utf-8")
+        monkeypatch.setattr(ingest, "TEXT_WINDOW_CHARS", 97)
+        memo_size = len(ingest._token_memo)
+        streamed = list(iter_file_chunks(f, chunk_size=50, overlap=10))
+        assert len(ingest._token_memo) == memo_size  # pieces bypass the in-memory memo
+        assert streamed == chunk_with_overlap(load_txt(f), chunk_size=50, overlap=10)
+
+
+class TestIterChunkedFilings:
+    def test_worker_pool_matches_serial_chunking(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(ingest.os, "cpu_count", lambda: 3)
+        monkeypatch.setattr(ingest, "TEXT_WINDOW_CHARS", 500)
+        files = []
+        for i, repeat in enumerate([200, 3]):
+            f = tmp_path / f"filing{i}.txt"
+            f.write_text(TestIterFileChunks.TEXT[: 60 * repeat], encoding="utf-8")
+            files.append((f, f"T{i}"))
+
+        out = [(t, s, list(c)) for t, s, c in ingest._iter_chunked_filings(files)]
+
+        assert out == [
+            (
+                t,
+                str(f),
+                chunk_with_overlap(
+                    load_txt(f), ingest.CHUNK_SIZE_TOKENS, ingest.CHUNK_OVERLAP_TOKENS
+                ),
+            )
+            for f, t in files
+        ]
+        assert len(out[0][2]) > 1
+
+
+class TestFormatCopyRow:
+    def test_tab_separated_fields(self):
+        row = _format_copy_row("Hello", [0.5, -1.0], "AAPL", "a.txt")
+        assert row == "Hello\t[0.5,-1]\tAAPL\ta.txt\n"
+
+    def test_fp16_vector_round_trips(self):
+        embedding = np.random.default_rng(0).standard_normal(384).astype(np.float16)
+        vector_text = _format_copy_row("x", embedding, "AAPL", "a.txt").split("\t")[1]
+        parsed = np.array(vector_text[1:-1].split(","), dtype=np.float64).astype(np.float16)
+        np.testing.assert_array_equal(parsed, embedding)
+
+    def test_escapes_special_characters(self):
+        row = _format_copy_row("a\tb\nc\\d\re", [0.0], "AAPL", "a.txt")
+        content = row.split("\t")[0]
+        assert content == "a\\tb\\nc\\\\d\\re"
+        assert row.count("\n") == 1
+
+
+class TestFlushChunks:
+    @patch("tiny_rag.ingest.store_in_pgvector")
+    @patch("tiny_rag.ingest.embed_chunks")
+    def test_rows_stay_with_their_filing(self, mock_embed, mock_store):
+        # A's second run is a later filing of the same ticker (different source)
+        batch = [
+            ("AAPL", "a1.txt", "a0"),
+            ("AAPL", "a1.txt", "a1"),
+            ("MSFT", "b1.txt", "b0"),
+            ("AAPL", "a2.txt", "c0"),
+        ]
+        mock_embed.side_effect = lambda chunks: np.arange(len(chunks), dtype=np.float32)[:, None]
+
+        _flush_chunks(batch)
+
+        calls = [c.kwargs for c in mock_store.call_args_list]
+        assert [(c["ticker"], c["source"], c["chunks"]) for c in calls] == [
+            ("AAPL", "a1.txt", ["a0", "a1"]),
+            ("MSFT", "b1.txt", ["b0"]),
+            ("AAPL", "a2.txt", ["c0"]),
+        ]
+        assert [c["embeddings"][:, 0].tolist() for c in calls] == [[0, 1], [2], [3]]
@@ -0,0 +1,31 @@
+"""
+Unit tests for scripts/process_documents.py.
+"""
+
+import importlib.util
+from pathlib import Path
+
+import pytest
+
+_SCRIPT = Path(__file__).resolve().parent.parent / "scripts" / "process_documents.py"
+_spec = importlib.util.spec_from_file_location("process_documents", _SCRIPT)
+process_documents = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(process_documents)
+
+
+class TestExtractFromXml:
+    def test_keeps_cdata(self, tmp_path):
+        pytest.importorskip("bs4")
+        path = tmp_path / "filing.xml"
+        path.write_text("<root><item><![CDATA[Revenue grew 10%]]></item><b>Net income</b></root>")
+        assert process_documents.extract_from_xml(path) == "Revenue grew 10%\nNet income"
+
+
+class TestExtractFromHtml:
+    def test_drops_script_and_style(self, tmp_path):
+        path = tmp_path / "filing.html"
+        path.write_text(
+            "<html><head><style>p {}</style><script>var x;</script></head>"
+            "<body><p>Risk factors</p><p>Revenue</p></body></html>"
+        )
+        assert process_documents.extract_from_html(path) == "Risk factors\nRevenue"
@@ -2,7 +2,19 @@
 Unit tests for tiny_rag.rag.
 """
 
-from tiny_rag.rag import build_rag_prompt, infer_ticker_from_query
+import asyncio
+import json
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from tiny_rag import rag
+from tiny_rag.rag import (
+    answer_batch_with_rag_async,
+    build_batched_rag_prompt,
+    build_rag_prompt,
+    call_ollama_async,
+    infer_ticker_from_query,
+    parse_batched_answers,
+)
 
 
 class TestInferTickerFromQuery:
@@ -25,6 +37,13 @@ class TestInferTickerFromQuery:
         assert infer_ticker_from_query("ALPHABET risks") == "GOOGL"
         assert infer_ticker_from_query("APPLE stock") == "AAPL"
 
+    def test_matches_whole_words_only(self):
+        assert infer_ticker_from_query("How is filing metadata stored?") is None
+        assert infer_ticker_from_query("Pineapple prices") is None
+
+    def test_first_mention_wins(self):
+        assert infer_ticker_from_query("Compare Nvidia with Apple") == "NVDA"
+
 
 class TestBuildRagPrompt:
     def test_includes_context_and_question(self):
@@ -52,3 +71,104 @@ class TestBuildRagPrompt:
         assert "[2]" in prompt
         assert "(A)" in prompt
         assert "(B)" in prompt
+
+
+class TestBatchedPrompt:
+    def test_numbers_questions_with_own_context(self):
+        prompt = build_batched_rag_prompt(
+            [
+                ("Apple risks?", [{"content": "Supply chain.", "ticker": "AAPL"}]),
+                ("Tesla risks?", [{"content": "Competition.", "ticker": "TSLA"}]),
+            ]
+        )
+        assert "Question 1: Apple risks?" in prompt
+        assert "Question 2: Tesla risks?" in prompt
+        assert (
+            prompt.index("Supply chain.")
+            < prompt.index("Question 2")
+            < prompt.index("Competition.")
+        )
+        assert '"answers"' in prompt
+
+    def test_parse_orders_by_id(self):
+        reply = json.dumps({"answers": [{"id": 2, "answer": "b"}, {"id": 1, "answer": "a"}]})
+        assert parse_batched_answers(reply, 2) == ["a", "b"]
+
+    def test_parse_rejects_bad_replies(self):
+        assert parse_batched_answers("not json", 1) is None
+        assert parse_batched_answers(json.dumps({"answers": [{"id": 1, "answer": "a"}]}), 2) is None
+        assert parse_batched_answers(json.dumps({"answer": "a"}), 1) is None
+
+    @staticmethod
+    def fake_ollama(calls, json_reply=None):
+        """call_ollama_async stand-in: answers JSON prompts per question, records each call."""
+
+        async def fake(prompt, client, format=None, num_ctx=None):
+            calls.append((format, num_ctx, prompt.count("### Question")))
+            if format != "json":
+                return "single"
+            if json_reply is not None:
+                return json_reply
+            n = prompt.count("### Question")
+            return json.dumps({"answers": [{"id": i, "answer": f"a{i}"} for i in range(1, n + 1)]})
+
+        return fake
+
+    @patch("tiny_rag.rag.call_ollama_async")
+    @patch("tiny_rag.rag.retrieve_context")
+    def test_unparsed_batch_falls_back_per_question(self, mock_retrieve, mock_ollama):
+        mock_retrieve.side_effect = lambda q, k, ticker: (
+            [] if q == "none" else [{"content": q, "ticker": ticker}]
+        )
+        calls = []
+        mock_ollama.side_effect = self.fake_ollama(calls, json_reply="{}")
+
+        results = asyncio.run(
+            answer_batch_with_rag_async(["a", "none", "b"], ["AAPL", None, "MSFT"])
+        )
+
+        assert [r["answer"] for r in results] == ["single", "No relevant context found.", "single"]
+        assert [fmt for fmt, _, _ in calls] == ["json", None, None]
+
+    @patch("tiny_rag.rag.call_ollama_async")
+    @patch("tiny_rag.rag.retrieve_context")
+    def test_default_config_batch_uses_one_json_call(self, mock_retrieve, mock_ollama):
+        # k=6 chunks of ~400 tokens (cl100k) each, as eval main() retrieves
+        chunk = "Revenue from cloud services grew while hardware margins declined. " * 40
+        mock_retrieve.side_effect = lambda q, k, ticker: [{"content": chunk, "ticker": "AAPL"}] * k
+        calls = []
+        mock_ollama.side_effect = self.fake_ollama(calls)
+
+        results = asyncio.run(answer_batch_with_rag_async(["a", "b"], [None, None], k=6))
+
+        assert [r["answer"] for r in results] == ["a1", "a2"]
+        assert calls == [("json", rag.OLLAMA_BATCH_NUM_CTX, 2)]
+
+    @patch("tiny_rag.rag.call_ollama_async")
+    @patch("tiny_rag.rag.retrieve_context")
+    def test_long_batch_splits_into_sub_batches(self, mock_retrieve, mock_ollama, monkeypatch):
+        mock_retrieve.side_effect = lambda q, k, ticker: [{"content": "x" * 400, "ticker": None}]
+        # Half the window fits two questions' prompt, not three
+        two = len(build_batched_rag_prompt([("q", mock_retrieve("q", 1, None))] * 2))
+        monkeypatch.setattr(rag, "OLLAMA_BATCH_NUM_CTX", 2 * (two // rag.CHARS_PER_TOKEN + 10))
+        calls = []
+        mock_ollama.side_effect = self.fake_ollama(calls)
+
+        results = asyncio.run(answer_batch_with_rag_async(list("qqqqq"), [None] * 5))
+
+        assert [r["answer"] for r in results] == ["a1", "a2", "a1", "a2", "single"]
+        assert [(fmt, n) for fmt, _, n in calls] == [("json", 2), ("json", 2), (None, 0)]
+
+
+class TestCallOllamaAsync:
+    def test_own_client_is_closed(self):
+        client = MagicMock()
+        client.__aenter__ = AsyncMock(return_value=client)
+        client.__aexit__ = AsyncMock(return_value=None)
+        client.chat = AsyncMock(return_value={"message": {"content": "ok"}})
+
+        with patch("ollama.AsyncClient", return_value=client):
+            assert asyncio.run(call_ollama_async("hi", format="json")) == "ok"
+
+        assert client.chat.call_args.kwargs["format"] == "json"
+        client.__aexit__.assert_awaited_once()
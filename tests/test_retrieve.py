@@ -0,0 +1,69 @@
+"""
+Unit tests for tiny_rag.retrieve.
+"""
+
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+import pytest
+
+from tiny_rag import embeddings, retrieve
+
+
+class TestEmbedQuery:
+    def setup_method(self):
+        retrieve._embed_query_cached.cache_clear()
+
+    def test_repeated_query_encodes_once(self, monkeypatch):
+        model = MagicMock()
+        model.encode.return_value = np.ones((1, 4), dtype=np.float32)
+        monkeypatch.setattr(embeddings, "get_embedding_model", lambda: model)
+
+        first = retrieve.embed_query("What are Apple's risks?")
+        second = retrieve.embed_query("What are Apple's risks?")
+
+        assert model.encode.call_count == 1
+        assert first.dtype == np.float32
+        np.testing.assert_array_equal(first, second)
+
+    def test_returns_writable_copy(self, monkeypatch):
+        model = MagicMock()
+        model.encode.return_value = np.ones((1, 4), dtype=np.float32)
+        monkeypatch.setattr(embeddings, "get_embedding_model", lambda: model)
+
+        retrieve.embed_query("q")[0] = 5.0
+
+        assert retrieve.embed_query("q")[0] == 1.0
+
+
+class TestPrepareConnection:
+    @patch("pgvector.psycopg2.register_vector")
+    def test_prepares_once_per_connection(self, mock_register):
+        conn = MagicMock()
+        retrieve._prepare_connection(conn)
+        retrieve._prepare_connection(conn)
+
+        executed = [c.args[0].split()[:2] for c in conn.cursor().execute.call_args_list]
+        assert executed == [
+            ["DEALLOCATE", "ALL"],
+            ["PREPARE", "retrieve_all(halfvec,"],
+            ["PREPARE", "retrieve_by_ticker(text,"],
+            ["SET", "hnsw.ef_search"],
+        ]
+        assert mock_register.call_count == 1
+        conn.commit.assert_called_once()
+
+    @patch("pgvector.psycopg2.register_vector")
+    def test_failed_attempt_is_retried(self, mock_register):
+        conn = MagicMock()
+        cur = conn.cursor()
+        cur.execute.side_effect = [None, RuntimeError("statement timeout"), None, None, None, None]
+
+        with pytest.raises(RuntimeError):
+            retrieve._prepare_connection(conn)
+        retrieve._prepare_connection(conn)
+
+        statements = [c.args[0].split()[0] for c in cur.execute.call_args_list]
+        # The retry starts over, DEALLOCATE first to drop what the failed attempt prepared
+        assert statements == ["DEALLOCATE", "PREPARE", "DEALLOCATE", "PREPARE", "PREPARE", "SET"]
+        conn.commit.assert_called_once()